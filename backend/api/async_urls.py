@@ -0,0 +1,43 @@
+from django.urls import include, path, re_path
+
+from api.pagination import RecipeCursorPagination
+from recipes.views import IngredientViewSet, RecipeViewSet, TagViewSet
+from users.views import UserViewSet
+
+
+def uses_cursor(request):
+    return RecipeCursorPagination.cursor_query_param in request.GET
+
+
+# GET-запросы обрабатываются асинхронно, остальные методы и
+# постраничный вывод по курсору - синхронными вьюсетами.
+urlpatterns = [
+    path('tags/', TagViewSet.as_async_view('alist', {'get': 'list'})),
+    re_path(
+        r'^tags/(?P<pk>\d+)/$',
+        TagViewSet.as_async_view('aretrieve', {'get': 'retrieve'})
+    ),
+    path(
+        'ingredients/',
+        IngredientViewSet.as_async_view('alist', {'get': 'list'})
+    ),
+    re_path(
+        r'^ingredients/(?P<pk>\d+)/$',
+        IngredientViewSet.as_async_view('aretrieve', {'get': 'retrieve'})
+    ),
+    path('recipes/', RecipeViewSet.as_async_view(
+        'alist', {'get': 'list', 'post': 'create'}, use_sync=uses_cursor
+    )),
+    re_path(r'^recipes/(?P<pk>\d+)/$', RecipeViewSet.as_async_view(
+        'aretrieve', {
+            'get': 'retrieve',
+            'put': 'update',
+            'patch': 'partial_update',
+            'delete': 'destroy',
+        }
+    )),
+    path('users/me/', UserViewSet.as_async_view(
+        'ame', {'get': 'me'}, **UserViewSet.me.kwargs
+    )),
+    path('', include('api.urls')),
+]
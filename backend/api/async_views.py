@@ -0,0 +1,130 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.http import Http404
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from foodgram.timing import timed
+
+
+async def aget_object_or_404(queryset, **filters):
+    """Асинхронный generics.get_object_or_404: некорректный id - тоже 404."""
+    try:
+        return await queryset.aget(**filters)
+    except (
+        TypeError, ValueError, ValidationError, queryset.model.DoesNotExist
+    ):
+        raise Http404(
+            f'No {queryset.model._meta.object_name} matches the given query.'
+        )
+
+
+class AsyncReadMixin:
+    """Асинхронная обработка GET-запросов вьюсета в режиме ASGI.
+
+    Запрос проходит те же аутентификацию, проверку прав, обработку
+    исключений и finalize_response, что и в синхронном вьюсете,
+    но обработчик - корутина на асинхронном ORM, а ответ всегда
+    в JSON. Остальные методы обрабатывает синхронный вьюсет в потоке.
+    """
+
+    @classmethod
+    def as_async_view(cls, handler, actions, use_sync=None, **initkwargs):
+        """Вьюха: GET - корутина handler, прочие методы - actions.
+
+        use_sync(request) позволяет отдать синхронному вьюсету и часть
+        GET-запросов, для которых нет асинхронной реализации.
+        """
+        sync_view = sync_to_async(cls.as_view(dict(actions), **initkwargs))
+
+        @csrf_exempt
+        async def view(request, *args, **kwargs):
+            if request.method != 'GET' or use_sync and use_sync(request):
+                return await sync_view(request, *args, **kwargs)
+            self = cls(**initkwargs)
+            self.action_map = actions
+            for method, action in actions.items():
+                setattr(self, method, getattr(self, action))
+            self.args = args
+            self.kwargs = kwargs
+            return await self.adispatch(
+                getattr(self, handler), request, *args, **kwargs
+            )
+
+        return view
+
+    async def adispatch(self, handler, request, *args, **kwargs):
+        self.format_kwarg = None
+        self.request = request = self.initialize_request(
+            request, *args, **kwargs
+        )
+        request.accepted_renderer = JSONRenderer()
+        request.accepted_media_type = JSONRenderer.media_type
+        self.headers = self.default_response_headers
+        try:
+            with timed('auth'):
+                await self.aperform_authentication(request)
+            self.check_permissions(request)
+            self.handler_started = time.perf_counter()
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        response = self.finalize_response(request, response, *args, **kwargs)
+        # Ответ 304 из get_not_modified - обычный HttpResponse.
+        if isinstance(response, Response):
+            response.render()
+        return response
+
+    async def alist(self, request, *args, **kwargs):
+        """list для вьюсетов без фильтров и пагинации."""
+        objects = [obj async for obj in self.get_queryset()]
+        return Response(self.get_serializer(objects, many=True).data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = await aget_object_or_404(
+            self.get_queryset(),
+            **{self.lookup_field: kwargs[lookup_url_kwarg]}
+        )
+        self.check_object_permissions(request, obj)
+        return Response(self.get_serializer(obj).data)
+
+    async def aperform_authentication(self, request):
+        """Аутентификаторы вьюсета должны поддерживать aauthenticate."""
+        for authenticator in request.authenticators:
+            user_auth = await authenticator.aauthenticate(request)
+            if user_auth is not None:
+                request.user, request.auth = user_auth
+                return
+        request.user, request.auth = AnonymousUser(), None
+
+    async def apaginate_queryset(self, queryset):
+        """paginate_queryset для PageNumberPagination на асинхронном ORM."""
+        paginator = self.paginator
+        paginator.request = self.request
+        page_size = paginator.get_page_size(self.request)
+        if not page_size:
+            return None
+        django_paginator = paginator.django_paginator_class(
+            queryset, page_size
+        )
+        # count - cached_property, поэтому число строк подставляется
+        # заранее и Paginator не выполнит синхронный COUNT сам.
+        django_paginator.count = await queryset.acount()
+        page_number = paginator.get_page_number(self.request, django_paginator)
+        try:
+            paginator.page = django_paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(paginator.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            ))
+        paginator.page.object_list = [
+            obj async for obj in paginator.page.object_list
+        ]
+        return paginator.page.object_list
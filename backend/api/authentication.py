@@ -0,0 +1,146 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import authentication, exceptions
+
+
+TOKEN_KEY = 'auth-token:{}'
+# Поля пользователя, которые не попадают в кэш.
+PRIVATE_USER_FIELDS = ('password',)
+
+
+def token_cache_key(key):
+    """Ключ кэша для токена: сам токен в имени ключа не хранится."""
+    return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def invalidate_tokens(keys):
+    """Удаляет токены из кэша после фиксации транзакции."""
+    cache_keys = [token_cache_key(key) for key in keys]
+    if cache_keys:
+        transaction.on_commit(lambda: cache.delete_many(cache_keys))
+
+
+def token_snapshot(token):
+    """Снимок токена для кэша: дата создания и поля пользователя без пароля.
+
+    Значения приводятся к простым типам: файл аватара, например,
+    сохранился бы вместе со ссылкой на весь объект пользователя.
+    """
+    user = token.user
+    return token.created, {
+        field.attname: field.get_prep_value(getattr(user, field.attname))
+        for field in user._meta.concrete_fields
+        if field.attname not in PRIVATE_USER_FIELDS
+    }
+
+
+def restore_token(model, key, snapshot):
+    """Токен и пользователь из снимка.
+
+    Пароль пользователя отложен и загружается из БД при обращении,
+    например при проверке текущего пароля.
+    """
+    created, fields = snapshot
+    user = get_user_model().from_db(
+        DEFAULT_DB_ALIAS, list(fields), list(fields.values())
+    )
+    token = model.from_db(
+        DEFAULT_DB_ALIAS, ['key', 'user_id', 'created'],
+        [key, user.pk, created]
+    )
+    token.user = user
+    return token
+
+
+class TokenAuthentication(authentication.TokenAuthentication):
+    """Аутентификация по токену, доступная и асинхронным вьюхам.
+
+    При общем кэше (SHARED_CACHE) снимок токена и пользователя без
+    хеша пароля хранится в нем AUTH_TOKEN_CACHE_TIMEOUT секунд,
+    поэтому запрос с известным токеном не обращается к БД. Удаление
+    токена и любое сохранение пользователя - смена пароля,
+    деактивация - сбрасывают запись (users.signals). Неверные токены
+    и неактивные пользователи не кэшируются.
+    """
+
+    def get_token_key(self, request):
+        """Ключ токена из заголовка Authorization или None."""
+        header = authentication.get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(header) == 1:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. No credentials provided.')
+            )
+        if len(header) > 2:
+            raise exceptions.AuthenticationFailed(_(
+                'Invalid token header. Token string should not contain '
+                'spaces.'
+            ))
+        try:
+            return header[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_(
+                'Invalid token header. Token string should not contain '
+                'invalid characters.'
+            ))
+
+    def authenticate(self, request):
+        key = self.get_token_key(request)
+        if key is None:
+            return None
+        return self.authenticate_credentials(key)
+
+    async def aauthenticate(self, request):
+        key = self.get_token_key(request)
+        if key is None:
+            return None
+        return await self.aauthenticate_credentials(key)
+
+    def authenticate_credentials(self, key):
+        if not settings.SHARED_CACHE:
+            return super().authenticate_credentials(key)
+        cache_key = token_cache_key(key)
+        snapshot = cache.get(cache_key)
+        if snapshot is not None:
+            token = restore_token(self.get_model(), key, snapshot)
+        else:
+            user, token = super().authenticate_credentials(key)
+            cache.set(
+                cache_key, token_snapshot(token),
+                settings.AUTH_TOKEN_CACHE_TIMEOUT
+            )
+        return token.user, token
+
+    async def aauthenticate_credentials(self, key):
+        if not settings.SHARED_CACHE:
+            token = await self.aget_token(key)
+            return token.user, token
+        cache_key = token_cache_key(key)
+        snapshot = await cache.aget(cache_key)
+        if snapshot is not None:
+            token = restore_token(self.get_model(), key, snapshot)
+        else:
+            token = await self.aget_token(key)
+            await cache.aset(
+                cache_key, token_snapshot(token),
+                settings.AUTH_TOKEN_CACHE_TIMEOUT
+            )
+        return token.user, token
+
+    async def aget_token(self, key):
+        model = self.get_model()
+        try:
+            token = await model.objects.select_related('user').aget(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return token
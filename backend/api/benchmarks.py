@@ -0,0 +1,581 @@
+import asyncio
+import base64
+import io
+import json
+import random
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Count, Q
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.test.client import MULTIPART_CONTENT
+from PIL import Image
+from rest_framework import authentication
+from rest_framework.authtoken.models import Token
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+
+from api.authentication import TokenAuthentication, token_cache_key
+from foodgram.constants import SIMILAR_RECIPES_COUNT
+from foodgram.uploads import LimitedMultiPartParser, UploadImageField
+from recipes.ingredient_index import IngredientIndex
+from recipes.models import Ingredient, Recipe, RecipeIngredients, Tag
+from recipes.search import search_recipes
+from recipes.serializers import RecipeCreateSerializer
+from recipes.shopping_cart import get_recipe_amounts, update_shopping_lists
+from recipes.similarity import similarity_matrix, top_similar
+from recipes.timeline import get_feed, get_joined_feed
+from users.models import Follow, User
+
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Регистрирует сценарий для команды benchmark."""
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+class Timings(list):
+    """Время прогонов в секундах и дополнительные показатели."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.extra = {}
+
+
+def percentile(values, share):
+    """Значение, которого не превышает доля share отсортированных values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def measure(func, repeat, memory=False, writes=False):
+    """Время выполнения func в секундах для каждого из repeat прогонов.
+
+    С memory=True дополнительно замеряется пик выделенной памяти
+    (tracemalloc), а с writes=True - число пишущих запросов к БД;
+    оба показателя - в отдельном прогоне.
+    """
+    timings = Timings()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        timings.extra['peak'] = f'{peak / 1024 / 1024:7.2f} MB'
+    if writes:
+        counter = WriteCounter()
+        with connection.execute_wrapper(counter):
+            func()
+        timings.extra['writes'] = counter.statements
+        timings.extra['rows'] = counter.rows
+    return timings
+
+
+class WriteCounter:
+    """Считает пишущие запросы и затронутые ими строки.
+
+    Число строк берется из rowcount курсора; для INSERT ... RETURNING
+    часть бэкендов его не сообщает.
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if sql.lstrip().upper().startswith(WRITE_STATEMENTS):
+            self.statements += 1
+            self.rows += max(context['cursor'].rowcount, 0)
+        return result
+
+
+INGREDIENT_QUERIES = ('с', 'са', 'сах', 'мол', 'масло', 'перец черный', 'ка')
+
+
+@scenario('ingredient_search')
+def ingredient_search(repeat):
+    """Поиск ингредиентов: icontains через ORM против индекса в памяти."""
+    index = IngredientIndex(
+        Ingredient.objects.values('id', 'name', 'measurement_unit')
+    )
+
+    def orm():
+        for query in INGREDIENT_QUERIES:
+            list(Ingredient.objects.filter(name__icontains=query).values(
+                'id', 'name', 'measurement_unit'
+            ))
+
+    def in_memory():
+        for query in INGREDIENT_QUERIES:
+            index.search(query)
+
+    return {
+        'orm': measure(orm, repeat),
+        'index': measure(in_memory, repeat),
+    }
+
+
+IMAGE_SIZE = (3000, 2000)
+
+
+def make_jpeg(size):
+    """JPEG из шума: плохо сжимается, поэтому файл близок к реальным фото."""
+    buffer = io.BytesIO()
+    Image.effect_noise(size, 64).convert('RGB').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+@scenario('image_upload')
+def image_upload(repeat):
+    """Загрузка изображения: base64 в JSON против файла в multipart."""
+    content = make_jpeg(IMAGE_SIZE)
+    factory = RequestFactory()
+    json_body = json.dumps({
+        'image': 'data:image/jpeg;base64,'
+        + base64.b64encode(content).decode()
+    })
+
+    def base64_json():
+        request = Request(
+            factory.generic(
+                'POST', '/', json_body, content_type='application/json'
+            ),
+            parsers=[JSONParser()]
+        )
+        UploadImageField().to_internal_value(request.data['image'])
+
+    def multipart():
+        request = Request(
+            factory.post('/', {
+                'image': SimpleUploadedFile('image.jpg', content, 'image/jpeg')
+            }, content_type=MULTIPART_CONTENT),
+            parsers=[LimitedMultiPartParser()]
+        )
+        UploadImageField().to_internal_value(request.FILES['image'])
+
+    return {
+        'base64': measure(base64_json, repeat, memory=True),
+        'multipart': measure(multipart, repeat, memory=True),
+    }
+
+
+RECIPE_INGREDIENTS = 20
+
+
+class FullReplaceSerializer(RecipeCreateSerializer):
+    """Прежнее обновление рецепта: все строки пересоздаются."""
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
+        old_amounts = get_recipe_amounts(instance)
+        RecipeIngredients.objects.filter(recipe=instance).delete()
+        self.create_recipe_ingredients(instance, ingredients)
+        deltas = {
+            ingr['id']: ingr['amount'] - old_amounts.pop(ingr['id'], 0)
+            for ingr in ingredients
+        }
+        deltas.update(
+            (ingredient, -amount) for ingredient, amount in old_amounts.items()
+        )
+        update_shopping_lists(
+            instance.in_shopping_cart_of.values_list('user_id', flat=True),
+            deltas
+        )
+        instance.tags.set(tags)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save()
+        return instance
+
+
+@scenario('recipe_update')
+def recipe_update(repeat):
+    """PATCH рецепта с изменением одного количества: замена против диффа.
+
+    Данные создаются во временной транзакции и откатываются.
+    """
+    with transaction.atomic():
+        author = User.objects.create(
+            username='benchmark', email='benchmark@example.com'
+        )
+        tags = [
+            Tag.objects.create(name=f'benchmark {i}', slug=f'benchmark-{i}')
+            for i in range(3)
+        ]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'benchmark {i}', measurement_unit='г')
+            for i in range(RECIPE_INGREDIENTS)
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='benchmark', text='benchmark',
+            cooking_time=10, image='recipes/images/benchmark.jpg'
+        )
+        recipe.tags.set(tags)
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        amounts = iter(range(2, 10 ** 9))
+
+        def patch(serializer_class):
+            def run():
+                data = {
+                    'name': 'benchmark',
+                    'tags': [tag.id for tag in tags],
+                    'ingredients': [
+                        {'id': ingredient.id, 'amount': 1}
+                        for ingredient in ingredients
+                    ],
+                }
+                data['ingredients'][0]['amount'] = next(amounts)
+                serializer = serializer_class(
+                    Recipe.objects.get(pk=recipe.pk), data=data, partial=True
+                )
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+            return run
+
+        results = {
+            'full_replace': measure(
+                patch(FullReplaceSerializer), repeat, writes=True
+            ),
+            'diff': measure(
+                patch(RecipeCreateSerializer), repeat, writes=True
+            ),
+        }
+        transaction.set_rollback(True)
+    return results
+
+
+SEARCH_SIZES = (1000, 10000, 50000)
+SEARCH_WORDS = (
+    'суп', 'салат', 'паста', 'пирог', 'соус', 'курица', 'говядина', 'рыба',
+    'картофель', 'капуста', 'морковь', 'лук', 'чеснок', 'сыр', 'сметана',
+    'жарить', 'варить', 'запекать', 'тушить', 'нарезать', 'посолить',
+)
+# Редкое слово встречается в RARE_COUNT рецептах при любом их числе.
+RARE_WORD = 'рататуй'
+RARE_COUNT = 5
+
+
+@scenario('recipe_search')
+def recipe_search(repeat):
+    """Полнотекстовый поиск против icontains при росте числа рецептов.
+
+    Данные создаются во временной транзакции и откатываются.
+    """
+    words = random.Random(0)
+    results = {}
+    with transaction.atomic():
+        author = User.objects.create(
+            username='benchmark', email='benchmark@example.com'
+        )
+        created = 0
+        for size in SEARCH_SIZES:
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=' '.join(words.sample(SEARCH_WORDS, 2)),
+                    text=' '.join(words.choices(SEARCH_WORDS, k=30)) + (
+                        f' {RARE_WORD}' if i < RARE_COUNT else ''
+                    ),
+                    cooking_time=10,
+                    image='recipes/images/benchmark.jpg'
+                )
+                for i in range(created, size)
+            )
+            created = size
+
+            def full_text():
+                list(search_recipes(
+                    Recipe.objects.all(), RARE_WORD
+                ).values_list('id', flat=True)[:10])
+
+            def icontains():
+                list(Recipe.objects.filter(
+                    Q(name__icontains=RARE_WORD) | Q(text__icontains=RARE_WORD)
+                ).values_list('id', flat=True)[:10])
+
+            results[f'search {size}'] = measure(full_text, repeat)
+            results[f'icontains {size}'] = measure(icontains, repeat)
+        transaction.set_rollback(True)
+    return results
+
+
+@scenario('db_connections')
+def db_connections(repeat):
+    """Запрос к API с новым соединением с БД и с постоянным.
+
+    Новое соединение на каждый запрос - поведение при DB_CONN_MAX_AGE=0.
+    """
+    client = Client()
+    connects = []
+
+    def request(reconnect):
+        def run():
+            if reconnect:
+                connection.close()
+            response = client.get('/api/tags/')
+            assert response.status_code == 200, response.status_code
+        return run
+
+    def counted(run):
+        connects.clear()
+        timings = measure(run, repeat)
+        timings.extra['connects'] = len(connects)
+        return timings
+
+    def on_connect(**kwargs):
+        connects.append(1)
+
+    connection_created.connect(on_connect)
+    try:
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            return {
+                'new connection': counted(request(reconnect=True)),
+                'persistent': counted(request(reconnect=False)),
+            }
+    finally:
+        connection_created.disconnect(on_connect)
+
+
+# Одновременных клиентов в режиме ASGI и задержка медленного клиента
+# на прием тела ответа, в секундах.
+CONCURRENT_CLIENTS = 10
+SLOW_CLIENT_DELAY = 0.02
+
+
+async def asgi_get(handler, path):
+    """GET-запрос к ASGI-приложению от клиента, медленно читающего ответ."""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'testserver')],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    disconnected = asyncio.Event()
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body':
+            await asyncio.sleep(SLOW_CLIENT_DELAY)
+
+    try:
+        await handler(scope, receive, send)
+    finally:
+        disconnected.set()
+    assert status == [200], status
+
+
+@scenario('concurrency')
+def concurrency(repeat):
+    """Пропускная способность одного воркера при медленных клиентах.
+
+    Синхронный воркер WSGI обслуживает клиентов по очереди и ждет, пока
+    каждый примет ответ. Воркер ASGI обслуживает CONCURRENT_CLIENTS
+    клиентов сразу: синхронные вьюхи по очереди выполняются в потоке,
+    а асинхронные уступают цикл событий на каждом запросе к БД. В extra -
+    запросов в секунду, время - от начала до конца ответа клиенту.
+    """
+    recipe_id = Recipe.objects.values_list('pk', flat=True).first()
+    paths = ['/api/tags/', '/api/recipes/', f'/api/recipes/{recipe_id}/']
+    paths = [paths[number % len(paths)] for number in range(repeat)]
+
+    def wsgi():
+        client = Client()
+        timings = Timings()
+        start = time.perf_counter()
+        for path in paths:
+            request_start = time.perf_counter()
+            response = client.get(path)
+            assert response.status_code == 200, response.status_code
+            time.sleep(SLOW_CLIENT_DELAY)
+            timings.append(time.perf_counter() - request_start)
+        timings.extra['rps'] = f'{repeat / (time.perf_counter() - start):.1f}'
+        return timings
+
+    def asgi():
+        handler = ASGIHandler()
+        timings = Timings()
+        queue = list(reversed(paths))
+
+        async def client():
+            while queue:
+                path = queue.pop()
+                request_start = time.perf_counter()
+                await asgi_get(handler, path)
+                timings.append(time.perf_counter() - request_start)
+
+        async def run():
+            await asyncio.gather(
+                *(client() for _ in range(CONCURRENT_CLIENTS))
+            )
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        timings.extra['rps'] = f'{repeat / (time.perf_counter() - start):.1f}'
+        return timings
+
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        results = {'wsgi': wsgi(), 'asgi sync views': asgi()}
+        with override_settings(ROOT_URLCONF='foodgram.async_urls'):
+            results['asgi async views'] = asgi()
+    return results
+
+
+@scenario('token_auth')
+def token_auth(repeat):
+    """Аутентификация запроса по токену: DRF с запросом к БД и с кэшем.
+
+    Токен создается во временной транзакции и откатывается. Кэш
+    токенов включается и на LocMemCache: замер идет в одном процессе.
+    """
+    with transaction.atomic(), override_settings(SHARED_CACHE=True):
+        user = User.objects.create(
+            username='benchmark', email='benchmark@example.com'
+        )
+        token = Token.objects.create(user=user)
+        request = RequestFactory().get(
+            '/api/users/me/', headers={'Authorization': f'Token {token.key}'}
+        )
+
+        def authenticate(authenticator):
+            def run():
+                authenticated, _ = authenticator.authenticate(
+                    Request(request)
+                )
+                assert authenticated.pk == user.pk
+            run()
+            with CaptureQueriesContext(connection) as queries:
+                run()
+            timings = measure(run, repeat)
+            timings.extra['queries'] = len(queries)
+            return timings
+
+        try:
+            results = {
+                'drf': authenticate(authentication.TokenAuthentication()),
+                'cached': authenticate(TokenAuthentication()),
+            }
+        finally:
+            cache.delete(token_cache_key(token.key))
+        transaction.set_rollback(True)
+    return results
+
+
+FEED_PAGE_SIZE = 10
+FEED_PAGES = 20
+
+
+@scenario('following_feed')
+def following_feed(repeat):
+    """Лента подписок пользователя с наибольшим числом подписок.
+
+    JOIN подписок с рецептами против таблицы лент; листаются
+    FEED_PAGES страниц по курсору. Ленты должны быть собраны
+    командой rebuild_timelines.
+    """
+    user = (
+        Follow.objects.values('user').annotate(follows=Count('pk'))
+        .order_by('-follows').first()['user']
+    )
+
+    def timeline(position, size):
+        with override_settings(FEED_TIMELINES=True):
+            return get_feed(user, position, size)
+
+    def pages(feed):
+        def run():
+            position = None
+            for _ in range(FEED_PAGES):
+                page = feed(position, FEED_PAGE_SIZE)
+                if len(page) < FEED_PAGE_SIZE:
+                    break
+                position = page[-1]
+        return run
+
+    return {
+        'join': measure(pages(
+            lambda position, size: get_joined_feed(user, position, size)
+        ), repeat),
+        'timeline': measure(pages(timeline), repeat),
+    }
+
+
+SIMILAR_BLOCK_SIZES = (32, 128, 1024)
+SIMILAR_INGREDIENT_WEIGHT = 0.3
+
+
+@scenario('similar_recipes')
+def similar_recipes(repeat):
+    """Расчет похожих рецептов по всем рецептам БД блоками разного размера.
+
+    Матрица признаков строится один раз; замеряются поиск top-K
+    и пик памяти. all - один блок на все рецепты, то есть полная
+    матрица оценок.
+    """
+    ids = np.array(
+        Recipe.objects.order_by('pk').values_list('pk', flat=True),
+        dtype=np.int64
+    )
+    matrix = similarity_matrix(ids, SIMILAR_INGREDIENT_WEIGHT)
+    rows = np.arange(len(ids))
+
+    def run(block_size):
+        def func():
+            for _ in top_similar(
+                matrix, rows, SIMILAR_RECIPES_COUNT, block_size
+            ):
+                pass
+        return func
+
+    # Полный расчет занимает секунды, поэтому прогонов не больше трех.
+    repeat = min(repeat, 3)
+    results = {
+        f'block {block_size}': measure(run(block_size), repeat, memory=True)
+        for block_size in SIMILAR_BLOCK_SIZES
+    }
+    results['all'] = measure(run(max(len(ids), 1)), repeat, memory=True)
+    return results
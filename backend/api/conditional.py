@@ -0,0 +1,38 @@
+import hashlib
+
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """ETag из версии объекта и флагов, зависящих от пользователя."""
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def get_not_modified(request, etag, last_modified):
+    """Ответ 304, если у клиента актуальная версия, иначе None.
+
+    Флаги избранного, корзины и подписки не меняют дату изменения,
+    поэтому If-Modified-Since учитывается только для анонимов,
+    а авторизованным пользователям достаточно сравнения ETag.
+    """
+    if not request.user.is_authenticated:
+        timestamp = last_modified.timestamp()
+    else:
+        timestamp = None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    """Заголовки ETag и Last-Modified с обязательной перепроверкой."""
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
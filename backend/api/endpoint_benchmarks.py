@@ -0,0 +1,342 @@
+import base64
+import io
+import json
+import time
+from itertools import count
+from urllib.parse import urlsplit
+
+from django.core.management import CommandError
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Favorited, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.short_links import encode_short_link
+from users.models import Follow, User
+
+
+PASSWORD = 'benchmark-password'
+# Сколько авторов, избранных рецептов и рецептов в корзине
+# у пользователя, от имени которого выполняются запросы.
+FOLLOWS = 20
+FAVORITES = 20
+CARTS = 20
+RECIPE_INGREDIENTS = 10
+BULK_SIZE = 10
+# Хэширование пароля намеренно медленное, такие запросы
+# повторяются меньшее число раз.
+PASSWORD_REPEAT = 3
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (230, 200, 160)).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+class Endpoint:
+    """Запрос к API для замера.
+
+    path форматируется атрибутами контекста, data может быть функцией
+    от контекста. setup выполняется перед каждым запросом вне замера
+    и возвращает данные в то состояние, в котором запрос успешен,
+    teardown - после запроса, если он мешает остальным.
+    """
+
+    def __init__(self, name, method, path, status=200, data=None,
+                 auth=True, setup=None, teardown=None, repeat=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.status = status
+        self.data = data
+        self.auth = auth
+        self.setup = setup
+        self.teardown = teardown
+        self.repeat = repeat
+
+    def request(self, client, context):
+        data = self.data(context) if callable(self.data) else self.data
+        headers = {}
+        if self.auth:
+            headers['Authorization'] = f'Token {context.token}'
+        kwargs = {}
+        if data is not None:
+            kwargs = {
+                'data': json.dumps(data), 'content_type': 'application/json'
+            }
+        return client.generic(
+            self.method, self.path.format(context=context),
+            headers=headers, **kwargs
+        )
+
+
+class Context:
+    """Пользователь с подписками, избранным и корзиной и объекты для URL.
+
+    Создается внутри транзакции, которую команда откатывает.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.numbers = count()
+        self.user = User.objects.create_user(
+            username='benchmark', email='benchmark@example.com',
+            first_name='Benchmark', last_name='Benchmark', password=PASSWORD
+        )
+        self.token = Token.objects.create(user=self.user).key
+        self.image = make_image()
+        self.tags = list(Tag.objects.values_list('pk', flat=True)[:3])
+        self.tag_slugs = '&'.join(
+            f'tags={slug}'
+            for slug in Tag.objects.values_list('slug', flat=True)[:2]
+        )
+        self.ingredients = list(
+            Ingredient.objects.values_list('pk', flat=True)
+            [:RECIPE_INGREDIENTS]
+        )
+        popular = Recipe.objects.order_by('-favorites_count', 'pk')
+        for author in (
+            User.objects.exclude(pk=self.user.pk)
+            .order_by('-recipes_count', 'pk')[:FOLLOWS]
+        ):
+            self.post(f'/api/users/{author.pk}/subscribe/')
+        for recipe in popular[:FAVORITES]:
+            self.post(f'/api/recipes/{recipe.pk}/favorite/')
+        for recipe in popular[:CARTS]:
+            self.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        # Вторая страница ленты подписок: курсор из ссылки next.
+        self.feed_page = urlsplit(self.client.get(
+            '/api/recipes/feed/',
+            headers={'Authorization': f'Token {self.token}'}
+        ).json()['next']).query
+        self.recipe = popular.first().pk
+        self.short_link = encode_short_link(self.recipe)
+        self.author = (
+            User.objects.exclude(pk=self.user.pk)
+            .annotate(followed=Exists(Follow.objects.filter(
+                user=self.user, following=OuterRef('pk')
+            )))
+            .filter(followed=False)
+            .order_by('-followers_count', 'pk')
+            .first().pk
+        )
+        self.other_recipe = (
+            popular.exclude(favorited_by__user=self.user)
+            .exclude(in_shopping_cart_of__user=self.user)
+            .first().pk
+        )
+        self.own_recipe = self.create_recipe()
+        self.ingredient = self.ingredients[0]
+        self.tag = self.tags[0]
+
+    def post(self, path, data=None):
+        response = self.client.post(
+            path, data, content_type='application/json',
+            headers={'Authorization': f'Token {self.token}'}
+        )
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{path}: {response.status_code} {response.content[:200]}'
+            )
+        return response
+
+    def recipe_data(self, amount=1):
+        return {
+            'name': f'Benchmark {next(self.numbers)}',
+            'text': 'Рецепт для замера производительности.',
+            'cooking_time': 10,
+            'image': self.image,
+            'tags': self.tags,
+            'ingredients': [
+                {'id': ingredient, 'amount': amount}
+                for ingredient in self.ingredients
+            ],
+        }
+
+    def create_recipe(self):
+        return self.post('/api/recipes/', self.recipe_data()).json()['id']
+
+    def new_user(self):
+        number = next(self.numbers)
+        return {
+            'email': f'benchmark{number}@example.com',
+            'username': f'benchmark{number}',
+            'first_name': 'Benchmark',
+            'last_name': 'Benchmark',
+            'password': PASSWORD,
+        }
+
+
+def follow_author(context):
+    Follow.objects.get_or_create(
+        user=context.user, following_id=context.author
+    )
+
+
+def unfollow_author(context):
+    Follow.objects.filter(
+        user=context.user, following_id=context.author
+    ).delete()
+
+
+def favorite_recipe(context):
+    Favorited.objects.get_or_create(
+        user=context.user, recipe_id=context.other_recipe
+    )
+
+
+def unfavorite_recipe(context):
+    Favorited.objects.filter(
+        user=context.user, recipe_id=context.other_recipe
+    ).delete()
+
+
+def add_to_cart(context):
+    if not ShoppingCart.objects.filter(
+        user=context.user, recipe_id=context.other_recipe
+    ).exists():
+        context.post(f'/api/recipes/{context.other_recipe}/shopping_cart/')
+
+
+def remove_from_cart(context):
+    if ShoppingCart.objects.filter(
+        user=context.user, recipe_id=context.other_recipe
+    ).exists():
+        context.client.delete(
+            f'/api/recipes/{context.other_recipe}/shopping_cart/',
+            headers={'Authorization': f'Token {context.token}'}
+        )
+
+
+def restore_token(context):
+    Token.objects.get_or_create(user=context.user, key=context.token)
+
+
+def new_recipe(context):
+    context.deleted_recipe = context.create_recipe()
+
+
+ENDPOINTS = [
+    Endpoint('auth_login', 'POST', '/api/auth/token/login/', auth=False,
+             data={'email': 'benchmark@example.com', 'password': PASSWORD},
+             repeat=PASSWORD_REPEAT),
+    Endpoint('auth_logout', 'POST', '/api/auth/token/logout/', status=204,
+             teardown=restore_token),
+    Endpoint('users_list', 'GET', '/api/users/'),
+    Endpoint('users_list_anonymous', 'GET', '/api/users/', auth=False),
+    Endpoint('users_create', 'POST', '/api/users/', status=201, auth=False,
+             data=Context.new_user, repeat=PASSWORD_REPEAT),
+    Endpoint('users_detail', 'GET', '/api/users/{context.author}/'),
+    Endpoint('users_me', 'GET', '/api/users/me/'),
+    Endpoint('users_set_password', 'POST', '/api/users/set_password/',
+             status=204, data={
+                 'current_password': PASSWORD, 'new_password': PASSWORD
+             }, repeat=PASSWORD_REPEAT),
+    Endpoint('users_avatar_put', 'PUT', '/api/users/me/avatar/',
+             data=lambda context: {'avatar': context.image}),
+    Endpoint('users_avatar_delete', 'DELETE', '/api/users/me/avatar/',
+             status=204),
+    Endpoint('users_subscriptions', 'GET',
+             '/api/users/subscriptions/?recipes_limit=3'),
+    Endpoint('users_subscribe', 'POST',
+             '/api/users/{context.author}/subscribe/', status=201,
+             setup=unfollow_author),
+    Endpoint('users_unsubscribe', 'DELETE',
+             '/api/users/{context.author}/subscribe/', status=204,
+             setup=follow_author),
+    Endpoint('tags_list', 'GET', '/api/tags/', auth=False),
+    Endpoint('tags_detail', 'GET', '/api/tags/{context.tag}/', auth=False),
+    Endpoint('ingredients_list', 'GET', '/api/ingredients/?name=са',
+             auth=False),
+    Endpoint('ingredients_detail', 'GET',
+             '/api/ingredients/{context.ingredient}/', auth=False),
+    Endpoint('recipes_list', 'GET', '/api/recipes/'),
+    Endpoint('recipes_list_anonymous', 'GET', '/api/recipes/', auth=False),
+    Endpoint('recipes_list_deep_page', 'GET', '/api/recipes/?page=100'),
+    Endpoint('recipes_list_cursor', 'GET', '/api/recipes/?cursor='),
+    Endpoint('recipes_list_tags', 'GET',
+             '/api/recipes/?{context.tag_slugs}'),
+    Endpoint('recipes_list_search', 'GET', '/api/recipes/?search=суп'),
+    Endpoint('recipes_list_author', 'GET',
+             '/api/recipes/?author={context.author}'),
+    Endpoint('recipes_list_favorited', 'GET',
+             '/api/recipes/?is_favorited=1'),
+    Endpoint('recipes_list_in_cart', 'GET',
+             '/api/recipes/?is_in_shopping_cart=1'),
+    Endpoint('recipes_feed', 'GET', '/api/recipes/feed/'),
+    Endpoint('recipes_feed_next_page', 'GET',
+             '/api/recipes/feed/?{context.feed_page}'),
+    Endpoint('recipes_detail', 'GET', '/api/recipes/{context.recipe}/'),
+    Endpoint('recipes_create', 'POST', '/api/recipes/', status=201,
+             data=Context.recipe_data),
+    Endpoint('recipes_bulk_create', 'POST', '/api/recipes/bulk/',
+             status=201, data=lambda context: [
+                 context.recipe_data() for _ in range(BULK_SIZE)
+             ]),
+    Endpoint('recipes_update', 'PATCH', '/api/recipes/{context.own_recipe}/',
+             data=lambda context: context.recipe_data(
+                 amount=next(context.numbers) % 100 + 1
+             )),
+    Endpoint('recipes_delete', 'DELETE',
+             '/api/recipes/{context.deleted_recipe}/', status=204,
+             setup=new_recipe),
+    Endpoint('recipes_get_link', 'GET',
+             '/api/recipes/{context.recipe}/get-link/'),
+    Endpoint('recipes_similar', 'GET',
+             '/api/recipes/{context.recipe}/similar/'),
+    Endpoint('recipes_favorite', 'POST',
+             '/api/recipes/{context.other_recipe}/favorite/', status=201,
+             setup=unfavorite_recipe),
+    Endpoint('recipes_unfavorite', 'DELETE',
+             '/api/recipes/{context.other_recipe}/favorite/', status=204,
+             setup=favorite_recipe),
+    Endpoint('recipes_shopping_cart', 'POST',
+             '/api/recipes/{context.other_recipe}/shopping_cart/',
+             status=201, setup=remove_from_cart),
+    Endpoint('recipes_shopping_cart_delete', 'DELETE',
+             '/api/recipes/{context.other_recipe}/shopping_cart/',
+             status=204, setup=add_to_cart),
+    Endpoint('recipes_download_txt', 'GET',
+             '/api/recipes/download_shopping_cart/?format=txt'),
+    Endpoint('recipes_download_pdf', 'GET',
+             '/api/recipes/download_shopping_cart/?format=pdf'),
+    Endpoint('short_link', 'GET', '/s/{context.short_link}/', status=302,
+             auth=False),
+]
+
+
+def run_endpoint(endpoint, context, repeat, warmup=1):
+    """Время, число SQL-запросов и размер ответа для каждого прогона.
+
+    Первые warmup прогонов - прогрев: первый из них выполняется
+    с пустым кэшем, и запросы прогрева учитываются, включая загрузку
+    фрагментов рецептов, а время - нет.
+    """
+    warmup = max(warmup, 1)
+    timings, queries, sizes = [], [], []
+    for _ in range((endpoint.repeat or repeat) + warmup):
+        if endpoint.setup:
+            endpoint.setup(context)
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = endpoint.request(context.client, context)
+            content = (
+                b''.join(response.streaming_content) if response.streaming
+                else response.content
+            )
+            timings.append(time.perf_counter() - start)
+        if endpoint.teardown:
+            endpoint.teardown(context)
+        if response.status_code != endpoint.status:
+            raise CommandError(
+                f'{endpoint.name}: ожидался статус {endpoint.status}, '
+                f'получен {response.status_code} {content[:200]}'
+            )
+        queries.append(len(captured))
+        sizes.append(len(content))
+    return timings[warmup:], queries, sizes
@@ -0,0 +1,35 @@
+import statistics
+
+from django.core.management import BaseCommand, CommandError
+
+from api.benchmarks import SCENARIOS, percentile
+
+
+class Command(BaseCommand):
+    help = 'Замер производительности. Сценарии: ' + ', '.join(SCENARIOS)
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', metavar='scenario')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные сценарии: {", ".join(sorted(unknown))}'
+            )
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            results = SCENARIOS[name](options['repeat'])
+            for label, timings in results.items():
+                extra = getattr(timings, 'extra', {})
+                p95 = percentile(timings, 0.95)
+                line = (
+                    f'  {label:<20} '
+                    f'p50 {statistics.median(timings) * 1000:9.3f} ms  '
+                    f'p95 {p95 * 1000:9.3f} ms'
+                )
+                for key, value in extra.items():
+                    line += f'  {key} {value}'
+                self.stdout.write(line)
@@ -0,0 +1,172 @@
+import json
+import math
+import statistics
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+
+from api.benchmarks import percentile
+from api.endpoint_benchmarks import ENDPOINTS, Context, run_endpoint
+
+
+BASELINE = settings.BASE_DIR / 'api' / 'benchmark_baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер всех эндпоинтов API через тестовый клиент на данных из БД: '
+        'время ответа, число SQL-запросов и размер ответа. Результаты '
+        'сравниваются с базовой линией: рост числа запросов или размера '
+        'ответа - ошибка, медленный ответ - предупреждение. '
+        'Все изменения откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('endpoints', nargs='*', metavar='endpoint')
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Прогоны перед замером времени; первый - с пустым кэшем.'
+        )
+        parser.add_argument('--baseline', default=BASELINE)
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Записать результаты как новую базовую линию.'
+        )
+        parser.add_argument(
+            '--strict-latency', action='store_true',
+            help='Считать превышение p95 ошибкой. Имеет смысл, только '
+                 'если базовая линия записана на этой же машине.'
+        )
+        parser.add_argument(
+            '--latency-tolerance', type=float, default=2.0,
+            help='Во сколько раз p95 может превысить базовое значение.'
+        )
+        parser.add_argument(
+            '--latency-slack', type=float, default=5.0,
+            help='Допустимое превышение p95 в мс для быстрых эндпоинтов, '
+                 'у которых шум больше относительного допуска.'
+        )
+        parser.add_argument(
+            '--bytes-tolerance', type=float, default=1.2,
+            help='Во сколько раз размер ответа может превысить базовый.'
+        )
+
+    def handle(self, *args, **options):
+        endpoints = {endpoint.name: endpoint for endpoint in ENDPOINTS}
+        names = options['endpoints'] or list(endpoints)
+        unknown = set(names) - set(endpoints)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}'
+            )
+        baseline = self.read_baseline(options['baseline'])
+        results = {}
+        failures = []
+        warnings = []
+        # Отдельный кэш и каталог файлов, чтобы замер не оставил
+        # в них следов после отката транзакции. Замер идет в одном
+        # процессе, поэтому локальный кэш заменяет общий (SHARED_CACHE).
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            MEDIA_ROOT=media_root,
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'benchmark-endpoints',
+            }},
+            SHARED_CACHE=True,
+            # Журнал медленных запросов не перемешивается с отчетом.
+            SLOW_REQUEST_THRESHOLD=math.inf,
+        ), transaction.atomic():
+            context = Context(Client())
+            for name in names:
+                cache.clear()
+                timings, queries, sizes = run_endpoint(
+                    endpoints[name], context, options['repeat'],
+                    options['warmup']
+                )
+                results[name] = {
+                    'queries': max(queries),
+                    'p95_ms': round(percentile(timings, 0.95) * 1000, 1),
+                    'bytes': max(sizes),
+                }
+                errors, slow = self.check_budget(
+                    results[name], baseline.get(name), options
+                )
+                if options['strict_latency']:
+                    errors, slow = errors + slow, []
+                failures += [f'{name}: {error}' for error in errors]
+                warnings += [f'{name}: {warning}' for warning in slow]
+                self.report(name, timings, results[name], errors, slow)
+            transaction.set_rollback(True)
+        if options['update_baseline']:
+            baseline.update(results)
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(baseline, file, indent=4, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовая линия записана в {options["baseline"]}.'
+            ))
+            return
+        if warnings:
+            self.stdout.write(self.style.WARNING(
+                'p95 выше базовой линии (время зависит от машины, '
+                'не ошибка без --strict-latency):\n' + '\n'.join(warnings)
+            ))
+        if failures:
+            raise CommandError(
+                'Превышен бюджет:\n' + '\n'.join(failures)
+            )
+
+    @staticmethod
+    def read_baseline(path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    @staticmethod
+    def check_budget(result, budget, options):
+        """Нарушения бюджета и превышения времени ответа.
+
+        Число запросов не должно расти вовсе, размер ответа - больше
+        допуска. Время ответа сравнивается с базовой линией отдельно:
+        оно зависит от машины и ее загрузки.
+        """
+        if budget is None:
+            return [], []
+        errors = []
+        slow = []
+        if result['queries'] > budget['queries']:
+            errors.append(
+                f'запросов {result["queries"]} > {budget["queries"]}'
+            )
+        limit = max(
+            budget['p95_ms'] * options['latency_tolerance'],
+            budget['p95_ms'] + options['latency_slack']
+        )
+        if result['p95_ms'] > limit:
+            slow.append(f'p95 {result["p95_ms"]} ms > {limit:.1f} ms')
+        limit = budget['bytes'] * options['bytes_tolerance']
+        if result['bytes'] > limit:
+            errors.append(f'ответ {result["bytes"]} Б > {limit:.0f} Б')
+        return errors, slow
+
+    def report(self, name, timings, result, errors, slow):
+        line = (
+            f'  {name:<30} '
+            f'p50 {statistics.median(timings) * 1000:9.3f} ms  '
+            f'p95 {result["p95_ms"]:9.1f} ms  '
+            f'queries {result["queries"]:3}  bytes {result["bytes"]:8}'
+        )
+        if errors:
+            line = self.style.ERROR(f'{line}  {"; ".join(errors + slow)}')
+        elif slow:
+            line = self.style.WARNING(f'{line}  {"; ".join(slow)}')
+        self.stdout.write(line)
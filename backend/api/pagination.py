@@ -0,0 +1,69 @@
+from base64 import b64decode, b64encode
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Постраничный вывод рецептов по курсору (created_at, id).
+
+    В отличие от номеров страниц не выполняет COUNT(*) и OFFSET,
+    поэтому время ответа не зависит от глубины ленты.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+
+class FeedCursorPagination(RecipeCursorPagination):
+    """Курсор ленты подписок: (created_at, id) последнего рецепта.
+
+    Лента собирается из нескольких источников, поэтому страницу
+    выбирает функция feed, а курсор указывает точное место в ленте
+    без смещений. Перелистывание только вперед.
+    """
+
+    def paginate_feed(self, feed, request):
+        """id рецептов страницы; feed(position, size) -> [(created_at, id)]."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        size = self.get_page_size(request)
+        items = feed(self.decode_position(request), size + 1)
+        self.next_position = items[size - 1] if len(items) > size else None
+        return [pk for _, pk in items[:size]]
+
+    def decode_position(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            created_at, pk = (
+                b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            )
+            position = parse_datetime(created_at), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if position[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        created_at, pk = self.next_position
+        encoded = b64encode(
+            f'{created_at.isoformat()}|{pk}'.encode('ascii')
+        ).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
@@ -0,0 +1,931 @@
+import json
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import token_cache_key
+from foodgram.constants import AVATAR_RENDITIONS, RECIPE_IMAGE_RENDITIONS
+from foodgram.renditions import mark_rendered
+from recipes.models import (Favorited, Ingredient, Recipe, RecipeIngredients,
+                            ShoppingCart, ShoppingListItem, Tag,
+                            TimelineEntry)
+from recipes.shopping_cart import aggregate_shopping_lists
+from recipes.short_links import (decode_short_link, encode_short_link,
+                                 resolve_legacy_short_link)
+from recipes.tag_masks import invalidate_tags
+from recipes.timeline import fan_out_recipes
+from users.models import Follow, User
+
+
+# Фрагменты рецептов строятся при каждом запросе, как без общего кэша:
+# так проверяется худший случай.
+@override_settings(SHARED_CACHE=False)
+class QueryCountTests(TestCase):
+    """Число SQL-запросов эндпоинтов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user('reader')
+        cls.authors = [cls.create_user(f'author{number}') for number in (1, 2)]
+        cls.tags = [
+            Tag.objects.create(name=slug, slug=slug)
+            for slug in ('breakfast', 'dinner')
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'сахар', 'мука')
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.user, following=author)
+
+    @staticmethod
+    def create_user(username):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            first_name=username, last_name=username, password='password'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipes(self, count):
+        recipes = []
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=self.authors[number % len(self.authors)],
+                name=f'Рецепт {number}', text='Описание', cooking_time=10,
+                image='recipes/test.png'
+            )
+            recipe.tags.set(self.tags)
+            RecipeIngredients.objects.bulk_create(
+                RecipeIngredients(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in self.ingredients
+            )
+            Favorited.objects.create(user=self.user, recipe=recipe)
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+            recipes.append(recipe)
+        return recipes
+
+    def assert_constant_queries(self, expected, path, grow=10):
+        """Одно и то же число запросов до и после добавления рецептов."""
+        for _ in range(2):
+            with self.assertNumQueries(expected):
+                response = self.client.get(path)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertEqual(response.status_code, 200)
+            self.create_recipes(grow)
+
+    def test_recipe_list(self):
+        self.create_recipes(2)
+        self.assert_constant_queries(5, '/api/recipes/?limit=50')
+
+    def test_recipe_detail(self):
+        recipe, = self.create_recipes(1)
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_subscriptions(self):
+        self.create_recipes(2)
+        self.assert_constant_queries(
+            3, '/api/users/subscriptions/?recipes_limit=3'
+        )
+
+    def test_download_shopping_cart(self):
+        self.create_recipes(2)
+        self.assert_constant_queries(
+            1, '/api/recipes/download_shopping_cart/?format=txt'
+        )
+
+    def test_users_list(self):
+        for number in range(3):
+            self.create_user(f'user{number}')
+        self.assert_users_queries(2)
+        for number in range(3, 10):
+            self.create_user(f'user{number}')
+        self.assert_users_queries(2)
+
+    def assert_users_queries(self, expected):
+        with self.assertNumQueries(expected):
+            response = self.client.get('/api/users/?limit=50')
+        self.assertEqual(response.status_code, 200)
+
+    def test_users_me(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+
+
+class RenditionsETagTests(TestCase):
+    """Готовые копии изображения - новая версия рецепта и профиля."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = QueryCountTests.create_user('author')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/test.png'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def assert_changed_after_render(self, path, key, renditions, instance,
+                                    field):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[key], {})
+        etag = response['ETag']
+        self.assertEqual(
+            self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        name = getattr(instance, field).name
+        self.assertTrue(
+            mark_rendered(type(instance), instance.pk, field, name)
+        )
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(set(response.json()[key]), set(renditions))
+
+    def test_recipe_etag_changes_when_rendered(self):
+        self.assert_changed_after_render(
+            f'/api/recipes/{self.recipe.pk}/', 'image_renditions',
+            RECIPE_IMAGE_RENDITIONS, self.recipe, 'image'
+        )
+
+    def test_profile_etag_changes_when_rendered(self):
+        User.objects.filter(pk=self.user.pk).update(avatar='avatars/a.png')
+        self.user.refresh_from_db()
+        self.assert_changed_after_render(
+            '/api/users/me/', 'avatar_renditions', AVATAR_RENDITIONS,
+            self.user, 'avatar'
+        )
+
+
+class ShoppingListTests(TestCase):
+    """Предрассчитанные списки покупок совпадают с корзинами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = QueryCountTests.create_user('author')
+        cls.buyers = [
+            QueryCountTests.create_user(f'buyer{number}')
+            for number in (1, 2)
+        ]
+        cls.tag = Tag.objects.create(name='dinner', slug='dinner')
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'сахар', 'мука')
+        ]
+
+    def setUp(self):
+        self.recipes = [self.create_recipe(number) for number in range(2)]
+        self.clients = []
+        for user in (self.author, *self.buyers):
+            client = APIClient()
+            client.force_authenticate(user)
+            self.clients.append(client)
+        for client in self.clients[1:]:
+            for recipe in self.recipes:
+                response = client.post(
+                    f'/api/recipes/{recipe.pk}/shopping_cart/'
+                )
+                self.assertEqual(response.status_code, 201)
+        self.assert_lists_match()
+
+    def create_recipe(self, number):
+        recipe = Recipe.objects.create(
+            author=self.author, name=f'Рецепт {number}', text='Описание',
+            cooking_time=10, image='recipes/test.png'
+        )
+        recipe.tags.set([self.tag])
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
+                recipe=recipe, ingredient=ingredient, amount=number + 1
+            )
+            for ingredient in self.ingredients[:2]
+        )
+        return recipe
+
+    def assert_lists_match(self):
+        self.assertEqual(
+            set(ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )),
+            set(aggregate_shopping_lists())
+        )
+
+    def test_remove_from_cart(self):
+        response = self.clients[1].delete(
+            f'/api/recipes/{self.recipes[0].pk}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assert_lists_match()
+
+    def test_update_ingredients(self):
+        salt, sugar, flour = self.ingredients
+        response = self.clients[0].patch(
+            f'/api/recipes/{self.recipes[0].pk}/',
+            {
+                'tags': [self.tag.pk],
+                'ingredients': [
+                    {'id': salt.pk, 'amount': 7}, {'id': flour.pk, 'amount': 2}
+                ],
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assert_lists_match()
+
+    def test_delete_recipe(self):
+        response = self.clients[0].delete(
+            f'/api/recipes/{self.recipes[0].pk}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assert_lists_match()
+
+    def test_delete_recipe_outside_api(self):
+        self.recipes[0].delete()
+        self.assert_lists_match()
+        Recipe.objects.filter(pk=self.recipes[1].pk).delete()
+        self.assert_lists_match()
+
+    def test_delete_author(self):
+        self.author.delete()
+        self.assert_lists_match()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_delete_buyer(self):
+        self.buyers[0].delete()
+        self.assert_lists_match()
+
+    def test_edit_recipe_ingredients_outside_api(self):
+        row = RecipeIngredients.objects.filter(recipe=self.recipes[0]).first()
+        row.amount = 10
+        row.save()
+        self.assert_lists_match()
+        row.ingredient = self.ingredients[2]
+        row.save()
+        self.assert_lists_match()
+        row.delete()
+        self.assert_lists_match()
+        RecipeIngredients.objects.create(
+            recipe=self.recipes[1], ingredient=self.ingredients[2], amount=3
+        )
+        self.assert_lists_match()
+
+    def test_delete_ingredient(self):
+        self.ingredients[0].delete()
+        self.assert_lists_match()
+
+
+@override_settings(SHARED_CACHE=True)
+class FragmentCacheTests(TestCase):
+    """Фрагменты рецептов в общем кэше и их сброс после правок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = QueryCountTests.create_user('author')
+        cls.reader = QueryCountTests.create_user('reader')
+        cls.tag = Tag.objects.create(name='dinner', slug='dinner')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/test.png'
+        )
+        cls.recipe.tags.set([cls.tag])
+        RecipeIngredients.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=5
+        )
+        Favorited.objects.create(user=cls.reader, recipe=cls.recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        self.path = f'/api/recipes/{self.recipe.pk}/'
+
+    def get(self, cache_stats, client=None):
+        response = (client or self.client).get(self.path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Recipe-Cache'], cache_stats)
+        return response.json()
+
+    def assert_invalidated(self, change):
+        self.get('hits=0, misses=1')
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        recipe = self.get('hits=0, misses=1')
+        self.get('hits=1, misses=0')
+        return recipe
+
+    def test_second_get_is_hit(self):
+        first = self.get('hits=0, misses=1')
+        self.assertEqual(self.get('hits=1, misses=0'), first)
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response['X-Recipe-Cache'], 'hits=1, misses=0')
+
+    def test_viewer_flags_not_cached(self):
+        self.assertTrue(self.get('hits=0, misses=1')['is_favorited'])
+        client = APIClient()
+        client.force_authenticate(self.author)
+        self.assertFalse(
+            self.get('hits=1, misses=0', client)['is_favorited']
+        )
+
+    def test_tag_change(self):
+        def change():
+            self.tag.name = 'ужин'
+            self.tag.save()
+
+        recipe = self.assert_invalidated(change)
+        self.assertEqual(recipe['tags'][0]['name'], 'ужин')
+
+    def test_ingredient_change(self):
+        def change():
+            self.ingredient.name = 'морская соль'
+            self.ingredient.save()
+
+        recipe = self.assert_invalidated(change)
+        self.assertEqual(recipe['ingredients'][0]['name'], 'морская соль')
+
+    def test_author_name_change(self):
+        def change():
+            author = User.objects.get(pk=self.author.pk)
+            author.first_name = 'Иван'
+            author.save()
+
+        recipe = self.assert_invalidated(change)
+        self.assertEqual(recipe['author']['first_name'], 'Иван')
+
+    def test_author_login_keeps_fragment(self):
+        self.get('hits=0, misses=1')
+        with self.captureOnCommitCallbacks(execute=True):
+            author = User.objects.get(pk=self.author.pk)
+            self.client.force_authenticate(None)
+            self.assertTrue(self.client.login(
+                username=author.email, password='password'
+            ))
+            author.refresh_from_db()
+            author.save()
+        self.client.force_authenticate(self.reader)
+        self.get('hits=1, misses=0')
+
+
+class ShortLinkTests(TestCase):
+    """Короткие ссылки на рецепты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = QueryCountTests.create_user('author')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/test.png', short_link='abc'
+        )
+
+    def setUp(self):
+        resolve_legacy_short_link.cache_clear()
+
+    def test_round_trip(self):
+        for recipe_id in (1, 2, 1000, 10 ** 9):
+            code = encode_short_link(recipe_id)
+            self.assertEqual(len(code), 6)
+            self.assertEqual(decode_short_link(code), recipe_id)
+
+    def test_get_link(self):
+        response = self.client.get(
+            f'/api/recipes/{self.recipe.pk}/get-link/'
+        )
+        self.assertEqual(response.status_code, 200)
+        code = response.json()['short-link'].rsplit('/', 1)[-1]
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/s/{code}/')
+        self.assertRedirects(
+            response, f'/recipes/{self.recipe.pk}/',
+            fetch_redirect_response=False
+        )
+
+    def test_get_link_missing_recipe(self):
+        response = self.client.get(
+            f'/api/recipes/{self.recipe.pk + 1}/get-link/'
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_legacy_code(self):
+        for expected_queries in (1, 0):
+            with self.assertNumQueries(expected_queries):
+                response = self.client.get('/s/abc/')
+            self.assertRedirects(
+                response, f'/recipes/{self.recipe.pk}/',
+                fetch_redirect_response=False
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertEqual(self.client.get('/s/abc/').status_code, 404)
+
+    def test_unknown_code(self):
+        for code in ('zz', 'abc-de', 'abcdefg'):
+            self.assertEqual(self.client.get(f'/s/{code}/').status_code, 404)
+
+
+class TagFilterTests(TestCase):
+    """Фильтр рецептов по маске тегов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = QueryCountTests.create_user('author')
+        cls.tags = [
+            Tag.objects.create(name=slug, slug=slug)
+            for slug in ('breakfast', 'dinner', 'dessert')
+        ]
+        cls.recipes = []
+        for number, tags in enumerate(([0], [1], [0, 2], [])):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/test.png'
+            )
+            recipe.tags.set(cls.tags[index] for index in tags)
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        invalidate_tags()
+
+    def assert_filtered(self, slugs, expected):
+        response = self.client.get(
+            '/api/recipes/', {'tags': slugs, 'limit': 10}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {recipe['id'] for recipe in response.json()['results']},
+            {self.recipes[index].pk for index in expected}
+        )
+
+    def test_filter(self):
+        self.assert_filtered(['breakfast'], [0, 2])
+        self.assert_filtered(['dinner', 'dessert'], [1, 2])
+
+    def test_unknown_slug(self):
+        response = self.client.get('/api/recipes/', {'tags': ['lunch']})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tags', response.json())
+
+    def test_rebuild_tag_masks(self):
+        """Теги и рецепты, созданные до появления масок."""
+        Tag.objects.update(bit=None)
+        Recipe.objects.update(tags_mask=0)
+        call_command('rebuild_tag_masks', stdout=StringIO())
+        invalidate_tags()
+        self.assertFalse(Tag.objects.filter(bit=None).exists())
+        self.assert_filtered(['breakfast'], [0, 2])
+        self.assert_filtered(['dessert'], [2])
+
+
+class ImportIngredientsTests(TestCase):
+    """Загрузка справочника ингредиентов командой import_ingredients."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def write(self, name, content):
+        path = self.directory / name
+        path.write_text(content, encoding='utf-8')
+        return path
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command(
+            'import_ingredients', str(path), '--batch-size=2', *args,
+            stdout=out
+        )
+        return out.getvalue()
+
+    def test_dry_run_matches_import(self):
+        path = self.write(
+            'ingredients.csv',
+            'соль,г\nсахар,г\nмука,г\nсахар,г\nмука,кг\n,г\n'
+        )
+        for args, expected in (
+            (['--dry-run'], 'Новых: 3, пропущено: 2'),
+            ([], 'Новых: 3, пропущено: 2'),
+            ([], 'Новых: 0, пропущено: 5'),
+        ):
+            with self.subTest(args=args):
+                self.assertIn(
+                    f'{expected}, с ошибками: 1', self.run_import(path, *args)
+                )
+        self.assertEqual(Ingredient.objects.count(), 4)
+
+    def test_json_invalid_items(self):
+        path = self.write('ingredients.json', json.dumps([
+            {'name': 'сахар', 'measurement_unit': 'г'},
+            'мука', ['мука', 'г'], {'name': 1, 'measurement_unit': 'г'},
+            {'name': 'мука'}, {'name': 'сахар', 'measurement_unit': 'г'},
+        ], ensure_ascii=False))
+        output = self.run_import(path, '--dry-run')
+        self.assertIn('Новых: 1, пропущено: 1, с ошибками: 4', output)
+        self.assertIn(
+            'Новых: 1, пропущено: 1, с ошибками: 4', self.run_import(path)
+        )
+        self.assertTrue(Ingredient.objects.filter(name='сахар').exists())
+
+
+class CursorPaginationTests(TestCase):
+    """Постраничный вывод рецептов по курсору."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = QueryCountTests.create_user('author')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/test.png'
+            )
+            for number in range(5)
+        ]
+
+    def read_pages(self, **params):
+        ids = []
+        url, data = '/api/recipes/', {'cursor': '', 'limit': 2, **params}
+        while url:
+            response = self.client.get(url, data)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page['results']), 2)
+            ids += [recipe['id'] for recipe in page['results']]
+            url, data = page['next'], None
+        return ids
+
+    def test_pages(self):
+        ids = [recipe.pk for recipe in self.recipes]
+        self.assertEqual(self.read_pages(), ids[::-1])
+        self.assertEqual(self.read_pages(ordering='-created_at'), ids[::-1])
+        self.assertEqual(self.read_pages(ordering='created_at'), ids)
+
+    def test_unsupported_params(self):
+        for params in (
+            {'search': 'рецепт'}, {'ordering': 'favorites_count'},
+            {'ordering': '-in_carts_count'},
+            {'ordering': 'created_at,favorites_count'},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(
+                    '/api/recipes/', {'cursor': '', **params}
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class SearchTests(TestCase):
+    """Полнотекстовый поиск на текущей СУБД: FTS5 или PostgreSQL."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = QueryCountTests.create_user('author')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=name, text=text, cooking_time=10,
+                image='recipes/test.png'
+            )
+            for name, text in (
+                ('Салат', 'Подается к борщ и хлебу'),
+                ('Борщ', 'Свекла и капуста'),
+                ('Каша', 'Овсянка на воде'),
+            )
+        ]
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_name_ranked_above_text(self):
+        salad, borscht, _ = self.recipes
+        self.assertEqual(self.search('борщ'), [borscht.pk, salad.pk])
+        self.assertEqual(self.search('свекла капуста'), [borscht.pk])
+        self.assertEqual(self.search('ананас'), [])
+
+    def test_index_follows_changes(self):
+        salad, borscht, porridge = self.recipes
+        porridge.name = 'Борщ зеленый'
+        porridge.save()
+        borscht.delete()
+        self.assertEqual(self.search('борщ'), [porridge.pk, salad.pk])
+        self.assertEqual(self.search('каша'), [])
+
+
+class ConditionalRequestTests(TestCase):
+    """ETag рецепта зависит от версии рецепта и флагов пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = QueryCountTests.create_user('author')
+        cls.reader = QueryCountTests.create_user('reader')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/test.png'
+        )
+
+    def setUp(self):
+        self.path = f'/api/recipes/{self.recipe.pk}/'
+        self.clients = {}
+        for user in (self.author, self.reader):
+            self.clients[user] = APIClient()
+            self.clients[user].force_authenticate(user)
+
+    def get(self, user, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.clients[user].get(self.path, **headers)
+
+    def test_not_modified(self):
+        etag = self.get(self.reader)['ETag']
+        response = self.get(self.reader, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('Authorization', response['Vary'])
+
+    def test_etag_per_viewer(self):
+        etag = self.get(self.reader)['ETag']
+        response = self.clients[self.reader].post(f'{self.path}favorite/')
+        self.assertEqual(response.status_code, 201)
+        response = self.get(self.reader, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_favorited'])
+        self.assertEqual(self.get(self.author, etag).status_code, 304)
+        self.assertEqual(
+            self.get(self.author, response['ETag']).status_code, 200
+        )
+
+    def test_recipe_change(self):
+        etag = self.get(self.reader)['ETag']
+        self.recipe.name = 'Новое название'
+        self.recipe.save()
+        self.assertEqual(self.get(self.reader, etag).status_code, 200)
+
+
+@override_settings(IMAGE_MAX_UPLOAD_SIZE=1024, IMAGE_MAX_PIXELS=100)
+class UploadLimitTests(TestCase):
+    """Ограничения размера и числа пикселей загружаемых изображений."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = QueryCountTests.create_user('user')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def make_png(size):
+        file = BytesIO()
+        Image.new('RGB', (size, size)).save(file, 'PNG')
+        return file.getvalue()
+
+    def put_avatar(self, content):
+        return self.client.put(
+            '/api/users/me/avatar/',
+            {'avatar': SimpleUploadedFile('a.png', content, 'image/png')},
+            format='multipart'
+        )
+
+    def test_file_too_large(self):
+        self.assertEqual(self.put_avatar(b'\0' * 2048).status_code, 413)
+
+    def test_request_too_large(self):
+        response = self.put_avatar(b'\0' * 128 * 1024)
+        self.assertEqual(response.status_code, 413)
+
+    def test_base64_too_large(self):
+        response = self.client.put(
+            '/api/users/me/avatar/',
+            {'avatar': 'data:image/png;base64,' + 'A' * 128 * 1024},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('avatar', response.json())
+
+    def test_too_many_pixels(self):
+        response = self.put_avatar(self.make_png(20))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('avatar', response.json())
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+
+class CounterTests(TestCase):
+    """Счетчики избранного, корзин, подписчиков и рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = QueryCountTests.create_user('author')
+        cls.reader = QueryCountTests.create_user('reader')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/test.png'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def assert_counter(self, instance, field, path, missing_status=400):
+        """Повторные добавление и удаление счетчик не меняют."""
+        for method, status_code, expected in (
+            ('post', 201, 1), ('post', 400, 1),
+            ('delete', 204, 0), ('delete', missing_status, 0),
+        ):
+            with self.subTest(method=method, expected=expected):
+                response = getattr(self.client, method)(path)
+                self.assertEqual(response.status_code, status_code)
+                instance.refresh_from_db()
+                self.assertEqual(getattr(instance, field), expected)
+
+    def test_favorites_count(self):
+        self.assert_counter(
+            self.recipe, 'favorites_count',
+            f'/api/recipes/{self.recipe.pk}/favorite/'
+        )
+
+    def test_in_carts_count(self):
+        self.assert_counter(
+            self.recipe, 'in_carts_count',
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        )
+
+    def test_followers_count(self):
+        self.assert_counter(
+            self.author, 'followers_count',
+            f'/api/users/{self.author.pk}/subscribe/', missing_status=404
+        )
+
+    def test_recipes_count(self):
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+        self.recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+
+@override_settings(FEED_TIMELINES=True, FEED_BACKFILL_SIZE=2)
+class TimelineTests(TestCase):
+    """Ленты подписок при подписке и отписке."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = QueryCountTests.create_user('author')
+        cls.reader = QueryCountTests.create_user('reader')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/test.png'
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        fan_out_recipes(self.recipes)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        self.path = f'/api/users/{self.author.pk}/subscribe/'
+
+    def get_feed(self):
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_backfill_and_trim(self):
+        self.assertEqual(self.get_feed(), [])
+        self.assertEqual(self.client.post(self.path).status_code, 201)
+        latest = [recipe.pk for recipe in self.recipes[:0:-1]]
+        self.assertEqual(
+            list(
+                TimelineEntry.objects.filter(user=self.reader)
+                .order_by('-created_at', '-recipe_id')
+                .values_list('recipe_id', flat=True)
+            ),
+            latest
+        )
+        self.assertEqual(self.get_feed(), latest)
+        self.assertEqual(self.client.delete(self.path).status_code, 204)
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader).exists()
+        )
+        self.assertEqual(self.get_feed(), [])
+
+
+class SimilarRecipesTests(TestCase):
+    """Похожие рецепты из предрассчитанной таблицы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = QueryCountTests.create_user('author')
+        users = [
+            QueryCountTests.create_user(f'user{number}')
+            for number in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('свекла', 'капуста', 'овсянка')
+        ]
+        cls.recipes = []
+        for number, used in enumerate(((0, 1), (0, 1), (2,))):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/test.png'
+            )
+            RecipeIngredients.objects.bulk_create(
+                RecipeIngredients(
+                    recipe=recipe, ingredient=ingredients[index], amount=1
+                )
+                for index in used
+            )
+            cls.recipes.append(recipe)
+        for user in users:
+            for recipe in cls.recipes[:2]:
+                Favorited.objects.create(user=user, recipe=recipe)
+
+    def test_similar(self):
+        call_command('build_similar_recipes', stdout=StringIO())
+        first, second, third = self.recipes
+        response = self.client.get(f'/api/recipes/{first.pk}/similar/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()], [second.pk]
+        )
+        response = self.client.get(f'/api/recipes/{third.pk}/similar/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_missing_recipe(self):
+        response = self.client.get(
+            f'/api/recipes/{self.recipes[-1].pk + 1}/similar/'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(SHARED_CACHE=True)
+class TokenCacheTests(TestCase):
+    """Снимок токена в общем кэше сбрасывается при выходе и смене пароля."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = QueryCountTests.create_user('user')
+
+    def setUp(self):
+        cache.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def assert_cached(self):
+        """Второй запрос с тем же токеном не обращается к БД."""
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.assertIsNotNone(cache.get(token_cache_key(self.token.key)))
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        self.assert_cached()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(cache.get(token_cache_key(self.token.key)))
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_password_change(self):
+        self.assert_cached()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': 'password', 'new_password': 'n3w-Pass!'
+            })
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(cache.get(token_cache_key(self.token.key)))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('n3w-Pass!'))
+        self.assert_cached()
+
+    def test_deactivated_user(self):
+        self.assert_cached()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
@@ -0,0 +1,16 @@
+from django.contrib import admin
+from django.urls import include, path
+
+from recipes.views import aredirect_from_short_link
+
+
+# URL режима ASGI: частые запросы чтения обрабатываются асинхронно.
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/', include('api.async_urls')),
+    path(
+        's/<str:short_link>/',
+        aredirect_from_short_link,
+        name='redirect_from_short_link'
+    ),
+]
@@ -1,8 +1,29 @@
 EMAIL_MAX_LENGTH = 254
 USER_MAX_LENGTH = 150
 TAG_MAX_LENGTH = 32
+# Сколько тегов помещается в маску тегов рецепта (BigInteger без знака).
+TAG_MASK_BITS = 63
+# Попытки занять свободный бит, если его одновременно занял другой тег.
+TAG_BIT_ATTEMPTS = 5
 PATTERN = r'^[\w.@+-]+\Z'
 INGREDIENT_NAME_MAX_LENGTH = 128
 MEASUREMENT_UNIT_MAX_LENGTH = 64
 RECIPE_NAME_MAX_LENGTH = 256
 SHORT_LINK_MAX_LENGTH = 32
+# Максимум рецептов в одном запросе пакетного создания.
+RECIPE_BULK_CREATE_MAX_SIZE = 100
+# Сколько похожих рецептов хранится для каждого рецепта.
+SIMILAR_RECIPES_COUNT = 10
+# Варианты изображений: имя -> (максимальный размер или None, формат).
+RECIPE_IMAGE_RENDITIONS = {
+    'thumbnail': ((400, 400), 'JPEG'),
+    'thumbnail_webp': ((400, 400), 'WEBP'),
+    'webp': (None, 'WEBP'),
+}
+AVATAR_RENDITIONS = {
+    'thumbnail': ((200, 200), 'JPEG'),
+    'thumbnail_webp': ((200, 200), 'WEBP'),
+}
+RENDITION_QUALITY = 85
+# Длина имени файла изображения, как у FileField по умолчанию.
+IMAGE_NAME_MAX_LENGTH = 100
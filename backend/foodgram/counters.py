@@ -0,0 +1,41 @@
+from django.db.models import F
+from django.db.models.signals import post_delete
+
+
+class DenormalizedFieldsMixin:
+    """Модель с полями, которые меняются только запросами UPDATE.
+
+    Это счетчики (change_counter) и другие денормализованные значения.
+    Обычное сохранение загруженного объекта не перезаписывает их
+    устаревшими значениями из памяти.
+    """
+    denormalized_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skipped = {
+                *self.denormalized_fields, *self.get_deferred_fields()
+            }
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+
+def change_counter(model, pk, field, delta, **values):
+    """Атомарно изменяет счетчик одной строки на delta.
+
+    Счетчик не уходит в минус, даже если успел разойтись с данными;
+    расхождения исправляет команда rebuild_counters. values - другие
+    поля строки, которые меняются тем же запросом UPDATE.
+    """
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta}, **values)
+
+
+def counter_delta(signal, created=False):
+    """+1 для новой строки, -1 для удаленной, 0 для изменения."""
+    return -1 if signal is post_delete else int(created)
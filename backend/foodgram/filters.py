@@ -2,13 +2,19 @@ import django_filters
 
 from rest_framework import filters
 
-from recipes.models import Recipe, Tag
+from recipes.models import Recipe
+from recipes.search import search_recipes
+from recipes.tag_masks import filter_by_tags, get_tags
 
 
 class NameFilter(filters.SearchFilter):
     search_param = 'name'
 
 
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tags()]
+
+
 # Поменял NumberFilter на BooleanFilter.
 # На уровне API работает, в самом проекте нет, т.к.
 # с фронтенда приходит следующий запрос:
@@ -25,11 +31,11 @@ class NameFilter(filters.SearchFilter):
 # ?is_in_shopping_cart=true или ?is_in_shopping_cart=false
 # то все работает.
 class RecipeFilter(django_filters.FilterSet):
-    tags = django_filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-        distinct=True
+    # Теги проверяются по словарю в памяти и фильтруются по маске
+    # тегов рецепта, без JOIN и DISTINCT.
+    tags = django_filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='filter_tags'
     )
     is_favorited = django_filters.BooleanFilter(
         method='filter_is_favorited'
@@ -37,11 +43,24 @@ class RecipeFilter(django_filters.FilterSet):
     is_in_shopping_cart = django_filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = django_filters.CharFilter(method='filter_search')
+    # Популярность берется из счетчиков рецепта, без агрегации.
+    ordering = django_filters.OrderingFilter(
+        fields=('created_at', 'favorites_count', 'in_carts_count')
+    )
 
     class Meta:
         model = Recipe
         fields = ['author', 'tags']
 
+    def __init__(self, data=None, *args, **kwargs):
+        super().__init__(data, *args, **kwargs)
+        # Тег, созданный в другом воркере, еще может отсутствовать
+        # в словаре этого процесса: словарь перечитывается до проверки.
+        slugs = data.getlist('tags') if data is not None else ()
+        if slugs:
+            get_tags(slugs)
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if user.is_authenticated and value:
@@ -53,3 +72,11 @@ class RecipeFilter(django_filters.FilterSet):
         if user.is_authenticated and value:
             return queryset.filter(in_shopping_cart_of__user=user)
         return queryset
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return filter_by_tags(queryset, value)
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value.strip())
@@ -0,0 +1,193 @@
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from rest_framework import serializers
+from rest_framework.fields import get_attribute
+
+from foodgram.constants import RENDITION_QUALITY
+
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+_executor = None
+
+
+def rendition_name(name, rendition, image_format):
+    """Путь варианта изображения рядом с оригиналом."""
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    extension = FORMAT_EXTENSIONS[image_format]
+    return posixpath.join(
+        directory, 'renditions', f'{stem}_{rendition}.{extension}'
+    )
+
+
+def generate_renditions(name, renditions, force=False):
+    """Создает недостающие варианты изображения, возвращает их число."""
+    pending = {
+        rendition: (size, image_format)
+        for rendition, (size, image_format) in renditions.items()
+        if force or not default_storage.exists(
+            rendition_name(name, rendition, image_format)
+        )
+    }
+    if not pending:
+        return 0
+    with default_storage.open(name) as file, Image.open(file) as original:
+        original = ImageOps.exif_transpose(original)
+        for rendition, (size, image_format) in pending.items():
+            image = original.copy()
+            if size:
+                image.thumbnail(size)
+            if image_format == 'JPEG' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, quality=RENDITION_QUALITY)
+            target = rendition_name(name, rendition, image_format)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+    return len(pending)
+
+
+def delete_renditions(name, renditions):
+    """Удаляет варианты изображения name."""
+    for rendition, (_, image_format) in renditions.items():
+        target = rendition_name(name, rendition, image_format)
+        if default_storage.exists(target):
+            default_storage.delete(target)
+
+
+def rendered_field(field):
+    """Поле модели с именем файла, для которого готовы варианты."""
+    return f'rendered_{field}'
+
+
+def mark_rendered(model, pk, field, name):
+    """Отмечает варианты файла name готовыми, если он все еще в поле.
+
+    updated_at меняется тем же запросом: ответ со ссылками на варианты -
+    новая версия объекта, и ETag старой версии не должен давать 304.
+    Возвращает True, если отметка изменилась.
+    """
+    rendered = rendered_field(field)
+    return bool(
+        model.objects.filter(pk=pk, **{field: name})
+        .exclude(**{rendered: name})
+        .update(**{rendered: name}, updated_at=timezone.now())
+    )
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RENDITION_WORKERS,
+            thread_name_prefix='renditions'
+        )
+    return _executor
+
+
+def schedule_renditions(instance, field, renditions, on_done=None):
+    """Генерация вариантов файла из поля field в пуле потоков.
+
+    Запускается после фиксации транзакции. Когда варианты готовы,
+    имя файла записывается в поле rendered_<field>, и вызывается
+    on_done - например, чтобы сбросить кэш с уже отданными ссылками.
+    """
+    model, pk = type(instance), instance.pk
+    name = getattr(instance, field).name
+
+    def run():
+        try:
+            generate_renditions(name, renditions)
+            if mark_rendered(model, pk, field, name) and on_done:
+                on_done()
+        except Exception:
+            logger.exception('Не удалось создать варианты %s', name)
+        finally:
+            connection.close()
+
+    transaction.on_commit(lambda: get_executor().submit(run))
+
+
+def remember_file(instance, field):
+    """Запоминает имя файла в поле field, не загружая отложенное поле."""
+    value = instance.__dict__.get(field)
+    setattr(
+        instance, f'_loaded_{field}', getattr(value, 'name', value) or ''
+    )
+
+
+def file_saved(instance, field, renditions, created, update_fields=None,
+               on_done=None):
+    """Варианты нового файла после сохранения объекта.
+
+    Ничего не делает, если файл не менялся: например, при сохранении
+    last_login. Варианты замененного файла удаляются, если на него
+    больше не ссылается ни один объект.
+    """
+    if update_fields is not None and field not in update_fields:
+        return
+    old = getattr(instance, f'_loaded_{field}', '')
+    new = getattr(instance, field).name or ''
+    if not created and old == new:
+        return
+    setattr(instance, f'_loaded_{field}', new)
+    if new:
+        schedule_renditions(instance, field, renditions, on_done)
+    if old and not created:
+        model = type(instance)
+
+        def cleanup():
+            try:
+                if not model.objects.filter(**{field: old}).exists():
+                    delete_renditions(old, renditions)
+            except Exception:
+                logger.exception('Не удалось удалить варианты %s', old)
+            finally:
+                connection.close()
+
+        transaction.on_commit(lambda: get_executor().submit(cleanup))
+
+
+class RenditionsField(serializers.ReadOnlyField):
+    """Ссылки на варианты изображения из поля source.
+
+    Готовность вариантов берется из поля rendered_<source>, без
+    обращений к хранилищу файлов.
+    """
+
+    def __init__(self, renditions, **kwargs):
+        self.renditions = renditions
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        owner = get_attribute(instance, self.source_attrs[:-1])
+        field = self.source_attrs[-1]
+        return getattr(owner, field), getattr(owner, rendered_field(field))
+
+    def to_representation(self, value):
+        value, rendered = value
+        if not value or value.name != rendered:
+            return {}
+        request = self.context.get('request')
+        urls = {}
+        for rendition, (_, image_format) in self.renditions.items():
+            url = default_storage.url(
+                rendition_name(value.name, rendition, image_format)
+            )
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[rendition] = url
+        return urls
@@ -34,6 +34,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -43,7 +44,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'foodgram.urls'
+# Режим ASGI (SERVER_MODE=asgi, задается в asgi.py): GET-запросы
+# к частым эндпоинтам чтения обрабатывают асинхронные вьюхи.
+ASYNC_VIEWS = os.getenv('SERVER_MODE', 'wsgi') == 'asgi'
+
+ROOT_URLCONF = 'foodgram.async_urls' if ASYNC_VIEWS else 'foodgram.urls'
 
 TEMPLATES = [
     {
@@ -74,7 +79,18 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'foodgram_user'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'foodgram_password'),
         'HOST': os.getenv('DB_HOST', 'db'),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Соединение переживает запрос и переиспользуется потоком
+        # воркера gunicorn; перед повторным использованием проверяется.
+        # Число соединений - GUNICORN_WORKERS * GUNICORN_THREADS.
+        # В режиме ASGI соединения не переиспользуются между запросами,
+        # поэтому по умолчанию закрываются сразу.
+        'CONN_MAX_AGE': int(
+            os.getenv('DB_CONN_MAX_AGE', 0 if ASYNC_VIEWS else 60)
+        ),
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true'
+        ),
     }
 }
 
@@ -99,6 +115,34 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Кэш общий для всех воркеров (Redis, Memcached, БД). Токены
+# и фрагменты рецептов кэшируются только в нем: из LocMemCache
+# запись удаляется лишь в воркере, который обработал изменение.
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Время жизни кэшированных фрагментов рецептов, в секундах.
+RECIPE_FRAGMENT_TIMEOUT = int(os.getenv('RECIPE_FRAGMENT_TIMEOUT', 24 * 60 * 60))
+
+# Время жизни токена со снимком пользователя в общем кэше, в секундах;
+# 0 или кэш без SHARED_CACHE - токен проверяется по БД в каждом запросе.
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 300))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -120,6 +164,52 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Время жизни индекса ингредиентов в памяти воркера, в секундах.
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+
+# Время жизни словаря тегов в памяти воркера, в секундах.
+TAG_CACHE_TTL = int(os.getenv('TAG_CACHE_TTL', 300))
+
+# Лента подписок по умолчанию читается одним JOIN подписок с рецептами:
+# на данных seed (10 000 рецептов, 1000 пользователей) он быстрее таблицы
+# лент при любом наборе подписок, от 10 до всех авторов. Включать таблицу
+# стоит, когда benchmark following_feed на рабочих данных покажет обратное.
+# С FEED_TIMELINES=true рецепт автора, у которого не больше
+# FEED_FANOUT_MAX_FOLLOWERS подписчиков, сразу записывается в их ленты;
+# рецепты остальных авторов читаются при запросе. После включения ленты
+# собирает команда rebuild_timelines.
+FEED_TIMELINES = os.getenv('FEED_TIMELINES', 'false').lower() == 'true'
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+# Сколько последних рецептов автора попадает в ленту при подписке.
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 50))
+
+# Параметры кодирования id рецепта в короткую ссылку.
+# Множитель должен быть взаимно прост с 62 ** 6 (нечетный и не кратный 31).
+# После публикации ссылок значения менять нельзя.
+SHORT_LINK_MULTIPLIER = int(os.getenv('SHORT_LINK_MULTIPLIER', 48271))
+SHORT_LINK_SALT = int(os.getenv('SHORT_LINK_SALT', 9137562841))
+
+# Загрузка изображений в API: файлы из multipart-запросов пишутся
+# во временные файлы (foodgram.uploads.LimitedMultiPartParser),
+# размер и число пикселей ограничены.
+IMAGE_MAX_UPLOAD_SIZE = int(os.getenv('IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 40_000_000))
+
+# Число потоков для создания уменьшенных копий изображений.
+RENDITION_WORKERS = int(os.getenv('RENDITION_WORKERS', 2))
+
+# Шрифт с кириллицей для списка покупок в формате pdf.
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Заголовок Server-Timing с временем этапов запроса и числом запросов
+# к БД - внутренние данные, поэтому по умолчанию выключен. Порог в мс,
+# начиная с которого запрос пишется в журнал foodgram.slow_requests.
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'false').lower() == 'true'
+SLOW_REQUEST_THRESHOLD = int(os.getenv('SLOW_REQUEST_THRESHOLD', 500))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -131,7 +221,13 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.TokenAuthentication',
+    ],
+
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'foodgram.uploads.LimitedMultiPartParser',
     ],
 
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
@@ -0,0 +1,242 @@
+import json
+import logging
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger('foodgram.slow_requests')
+
+# Этапы запроса в заголовке Server-Timing, кроме db и total.
+PHASES = ('auth', 'view', 'serialize', 'image', 'render')
+# Сколько повторяющихся форм SQL попадает в журнал медленных запросов.
+TOP_SQL_SHAPES = 5
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Время этапов одного запроса и статистика его SQL-запросов."""
+
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self.depth = Counter()
+        self.queries = 0
+        self.db_time = 0.0
+        # Текст запроса с плейсхолдерами вместо параметров:
+        # нормализуется только при записи в журнал.
+        self.sql = Counter()
+        self.sql_time = defaultdict(float)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            self.sql[sql] += 1
+            self.sql_time[sql] += elapsed
+
+    def top_sql(self):
+        """Повторяющиеся формы запросов, от самых частых."""
+        shapes = Counter()
+        shape_time = defaultdict(float)
+        for sql, count in self.sql.items():
+            shape = sql_shape(sql)
+            shapes[shape] += count
+            shape_time[shape] += self.sql_time[sql]
+        return [
+            {
+                'sql': shape,
+                'count': count,
+                'ms': round(shape_time[shape] * 1000, 1),
+            }
+            for shape, count in shapes.most_common(TOP_SQL_SHAPES)
+            if count > 1
+        ]
+
+
+def sql_shape(sql):
+    """SQL без списков параметров и чисел: IN (%s, %s) -> IN (...)."""
+    sql = re.sub(r'\((?:\s*%s\s*,)+\s*%s\s*\)', '(...)', sql)
+    sql = re.sub(r'(?:\(\.\.\.\)\s*,\s*)+\(\.\.\.\)', '(...)', sql)
+    sql = re.sub(r'\b\d+\b', 'N', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+@contextmanager
+def timed(phase):
+    """Добавляет время блока к этапу phase текущего запроса.
+
+    Вложенные блоки одного этапа не учитываются повторно, например
+    сериализатор, вызванный из другого сериализатора.
+    """
+    timings = _current.get()
+    if timings is None or timings.depth[phase]:
+        yield
+        return
+    timings.depth[phase] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.phases[phase] += time.perf_counter() - start
+        timings.depth[phase] -= 1
+
+
+def add_phase(phase, seconds):
+    """Добавляет время к этапу phase текущего запроса."""
+    timings = _current.get()
+    if timings is not None:
+        timings.phases[phase] += seconds
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper всех соединений: учет запроса в текущем запросе.
+
+    Обертка ставится один раз при подключении, а не в middleware:
+    в режиме ASGI ORM работает в потоке sync_to_async со своими
+    объектами соединений, куда доходит только контекст запроса.
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+def add_query_recorder(sender, connection, **kwargs):
+    # В начало списка: execute_wrapper() снимает свою обертку через pop(),
+    # и подключение внутри него не должно сдвинуть ее.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def install():
+    """Замеры SQL-запросов всех соединений."""
+    connection_created.connect(
+        add_query_recorder, dispatch_uid='foodgram.timing'
+    )
+
+
+class TimingMixin:
+    """Этапы запроса DRF-вьюхи для Server-Timing.
+
+    auth - аутентификация, view - обработчик вместе с сериализацией,
+    render - рендеринг ответа после выхода из вьюхи.
+    """
+
+    handler_started = None
+
+    def perform_authentication(self, request):
+        with timed('auth'):
+            super().perform_authentication(request)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.handler_started = time.perf_counter()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self.handler_started is not None:
+            add_phase('view', time.perf_counter() - self.handler_started)
+            self.handler_started = None
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        # Ответ 304 из get_not_modified не рендерится.
+        if hasattr(response, 'add_post_render_callback'):
+            start = time.perf_counter()
+            response.add_post_render_callback(
+                lambda response: add_phase(
+                    'render', time.perf_counter() - start
+                )
+            )
+        return response
+
+
+class ServerTimingMiddleware:
+    """Заголовок Server-Timing и журнал медленных запросов.
+
+    Считает число и время SQL-запросов через record_query и время
+    этапов, отмеченных timed. Для потоковых ответов время передачи
+    тела не учитывается. Работает и в синхронном, и в асинхронном
+    режиме, чтобы не переводить асинхронные вьюхи в поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.acall(request)
+        timings, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, start)
+
+    async def acall(self, request):
+        timings, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, start)
+
+    @staticmethod
+    def start():
+        timings = RequestTimings()
+        return timings, _current.set(timings), time.perf_counter()
+
+    def finish(self, request, response, timings, start):
+        total = time.perf_counter() - start
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = self.header(timings, total)
+        if total * 1000 >= settings.SLOW_REQUEST_THRESHOLD:
+            self.log(request, response, timings, total)
+        return response
+
+    @staticmethod
+    def header(timings, total):
+        metrics = [
+            f'db;dur={timings.db_time * 1000:.1f};'
+            f'desc="{timings.queries} queries"'
+        ]
+        metrics += [
+            f'{phase};dur={timings.phases[phase] * 1000:.1f}'
+            for phase in PHASES if phase in timings.phases
+        ]
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+    @staticmethod
+    def log(request, response, timings, total):
+        record = {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(timings.db_time * 1000, 1),
+            'queries': timings.queries,
+            **{
+                f'{phase}_ms': round(duration * 1000, 1)
+                for phase, duration in timings.phases.items()
+            },
+            'top_sql': timings.top_sql(),
+        }
+        logger.warning(
+            json.dumps(record, ensure_ascii=False), extra={'timings': record}
+        )
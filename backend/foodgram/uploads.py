@@ -0,0 +1,117 @@
+import io
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import MultiPartParser
+
+from foodgram.timing import timed
+
+
+ALLOWED_IMAGE_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+# Служебная часть multipart-запроса сверх самого файла.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def upload_too_large_message():
+    return (
+        'Размер файла не должен превышать '
+        f'{filesizeformat(settings.IMAGE_MAX_UPLOAD_SIZE)}.'
+    )
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_code = 'upload_too_large'
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загружаемые файлы во временные файлы по мере получения.
+
+    Слишком большой запрос отклоняется по Content-Length, а файл -
+    как только полученные данные превысят IMAGE_MAX_UPLOAD_SIZE.
+    Исключение UploadTooLarge обрабатывает DRF, поэтому обработчик
+    ставится только парсером API (LimitedMultiPartParser).
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > (
+            settings.IMAGE_MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD
+        ):
+            raise UploadTooLarge(upload_too_large_message())
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.IMAGE_MAX_UPLOAD_SIZE:
+            raise UploadTooLarge(upload_too_large_message())
+        return super().receive_data_chunk(raw_data, start)
+
+
+class LimitedMultiPartParser(MultiPartParser):
+    """multipart-парсер API: файлы пишутся во временные файлы,
+    размер ограничен IMAGE_MAX_UPLOAD_SIZE, превышение - ответ 413."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        request.upload_handlers = [
+            LimitedTemporaryFileUploadHandler(request._request)
+        ]
+        return super().parse(stream, media_type, parser_context)
+
+
+def check_image_header(file):
+    """Проверка формата и числа пикселей по заголовку изображения.
+
+    Image.open читает только заголовок, поэтому изображение-бомба
+    отклоняется до того, как будет декодировано.
+    """
+    try:
+        with Image.open(file) as image:
+            image_format, (width, height) = image.format, image.size
+    except (OSError, Image.DecompressionBombError):
+        raise serializers.ValidationError('Загрузите корректное изображение.')
+    finally:
+        file.seek(0)
+    if image_format not in ALLOWED_IMAGE_FORMATS:
+        raise serializers.ValidationError(
+            'Допустимые форматы: jpg, png, gif, webp.'
+        )
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise serializers.ValidationError(
+            f'Изображение больше {settings.IMAGE_MAX_PIXELS} пикселей.'
+        )
+    return image_format
+
+
+class UploadImageField(Base64ImageField):
+    """Изображение из файла multipart-запроса или из строки base64.
+
+    Файл из multipart уже лежит во временном файле и проверяется
+    по заголовку без загрузки в память; base64 оставлен для
+    совместимости с текущим фронтендом.
+    """
+
+    def to_internal_value(self, data):
+        with timed('image'):
+            return self.decode_image(data)
+
+    def decode_image(self, data):
+        if isinstance(data, UploadedFile):
+            if data.size > settings.IMAGE_MAX_UPLOAD_SIZE:
+                raise serializers.ValidationError(upload_too_large_message())
+            check_image_header(data)
+            return serializers.ImageField.to_internal_value(self, data)
+        if isinstance(data, str) and len(data) > (
+            settings.IMAGE_MAX_UPLOAD_SIZE * 4 // 3 + MULTIPART_OVERHEAD
+        ):
+            raise serializers.ValidationError(upload_too_large_message())
+        return super().to_internal_value(data)
+
+    def get_file_extension(self, filename, decoded_file):
+        image_format = check_image_header(io.BytesIO(decoded_file))
+        return 'jpg' if image_format == 'JPEG' else image_format.lower()
@@ -0,0 +1,28 @@
+import os
+
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8090')
+# SERVER_MODE=asgi - uvicorn-воркеры, и медленный клиент или ожидание
+# БД в асинхронной вьюхе не занимают воркер целиком.
+if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+# Один воркер, как у gunicorn по умолчанию: при локальном кэше
+# (LocMemCache) у каждого воркера своя копия кэша и словаря тегов.
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+# Каждый поток держит свое соединение с БД (DB_CONN_MAX_AGE). Сервер
+# не запускается, если соединений больше, чем отведено приложению
+# из max_connections PostgreSQL (100 по умолчанию, 3 из них
+# зарезервированы для суперпользователя).
+db_max_connections = int(os.getenv('DB_MAX_CONNECTIONS', 97))
+if workers * threads > db_max_connections:
+    raise RuntimeError(
+        f'GUNICORN_WORKERS * GUNICORN_THREADS = {workers * threads} '
+        f'соединений с БД больше DB_MAX_CONNECTIONS = {db_max_connections}.'
+    )
+# Воркеры периодически перезапускаются, закрывая свои соединения.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
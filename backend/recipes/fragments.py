@@ -0,0 +1,75 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+FRAGMENT_KEY = 'recipe-fragment:{}'
+
+
+def get_recipe_fragments(recipe_ids, build, stats=None):
+    """Фрагменты рецептов из кэша; недостающие строятся функцией build.
+
+    build принимает список id и возвращает словарь {id: фрагмент}.
+    В stats, если он передан, накапливаются попадания и промахи.
+    Без общего кэша (SHARED_CACHE) фрагменты строятся каждый раз:
+    в кэше воркера после правки рецепта в другом воркере остался бы
+    устаревший фрагмент.
+    """
+    if not settings.SHARED_CACHE:
+        if stats is not None:
+            stats['misses'] += len(recipe_ids)
+        return build(recipe_ids)
+    keys = {pk: FRAGMENT_KEY.format(pk) for pk in recipe_ids}
+    cached = cache.get_many(keys.values())
+    fragments = {
+        pk: cached[key] for pk, key in keys.items() if key in cached
+    }
+    missing = [pk for pk in keys if pk not in fragments]
+    if missing:
+        built = build(missing)
+        cache.set_many(
+            {keys[pk]: fragment for pk, fragment in built.items()},
+            settings.RECIPE_FRAGMENT_TIMEOUT
+        )
+        fragments.update(built)
+    if stats is not None:
+        stats['hits'] += len(keys) - len(missing)
+        stats['misses'] += len(missing)
+    return fragments
+
+
+async def aget_recipe_fragments(recipe_ids, build, stats=None):
+    """get_recipe_fragments для асинхронных вьюх.
+
+    Недостающие фрагменты строятся в потоке: build читает рецепты
+    синхронным ORM с prefetch_related.
+    """
+    if not settings.SHARED_CACHE:
+        if stats is not None:
+            stats['misses'] += len(recipe_ids)
+        return await sync_to_async(build)(recipe_ids)
+    keys = {pk: FRAGMENT_KEY.format(pk) for pk in recipe_ids}
+    cached = await cache.aget_many(keys.values())
+    fragments = {
+        pk: cached[key] for pk, key in keys.items() if key in cached
+    }
+    missing = [pk for pk in keys if pk not in fragments]
+    if missing:
+        built = await sync_to_async(build)(missing)
+        await cache.aset_many(
+            {keys[pk]: fragment for pk, fragment in built.items()},
+            settings.RECIPE_FRAGMENT_TIMEOUT
+        )
+        fragments.update(built)
+    if stats is not None:
+        stats['hits'] += len(keys) - len(missing)
+        stats['misses'] += len(missing)
+    return fragments
+
+
+def invalidate_recipe_fragments(recipe_ids):
+    """Удаляет фрагменты рецептов из кэша после фиксации транзакции."""
+    keys = [FRAGMENT_KEY.format(pk) for pk in recipe_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,126 @@
+import bisect
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from recipes.models import Ingredient
+
+
+TRIGRAM_SIZE = 3
+
+
+def trigrams(text):
+    """Набор триграмм строки."""
+    return {
+        text[i:i + TRIGRAM_SIZE]
+        for i in range(len(text) - TRIGRAM_SIZE + 1)
+    }
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Сначала выдаются ингредиенты, название которых начинается с запроса,
+    затем те, где запрос встречается внутри названия (раньше вхождение -
+    выше в выдаче). Внутри групп порядок - по названию и id.
+    """
+
+    def __init__(self, ingredients):
+        self.items = {}
+        self.names = {}
+        self.trigrams = {}
+        for item in ingredients:
+            name = item['name'].lower()
+            self.items[item['id']] = item
+            self.names[item['id']] = name
+            for trigram in trigrams(name):
+                self.trigrams.setdefault(trigram, set()).add(item['id'])
+        self.sorted_names = sorted(
+            (name, pk) for pk, name in self.names.items()
+        )
+        self.sorted_ids = sorted(self.items)
+
+    def all(self):
+        return [self.items[pk] for pk in self.sorted_ids]
+
+    def prefix_ids(self, query):
+        start = bisect.bisect_left(self.sorted_names, (query,))
+        ids = []
+        for name, pk in self.sorted_names[start:]:
+            if not name.startswith(query):
+                break
+            ids.append(pk)
+        return ids
+
+    def candidate_ids(self, query):
+        if len(query) < TRIGRAM_SIZE:
+            return self.names.keys()
+        sets = sorted(
+            (self.trigrams.get(trigram, set()) for trigram in trigrams(query)),
+            key=len
+        )
+        return set.intersection(*sets)
+
+    def search(self, query):
+        query = query.strip().lower()
+        if not query:
+            return self.all()
+        prefix = self.prefix_ids(query)
+        found = set(prefix)
+        substring = sorted(
+            (self.names[pk].find(query), self.names[pk], pk)
+            for pk in self.candidate_ids(query)
+            if pk not in found and query in self.names[pk]
+        )
+        return [self.items[pk] for pk in prefix] + [
+            self.items[pk] for _, _, pk in substring
+        ]
+
+
+_index = None
+_built_at = 0
+_lock = threading.Lock()
+
+
+def get_index():
+    """Возвращает индекс, строя его при первом обращении.
+
+    Сигналы сбрасывают индекс только в своем процессе, поэтому
+    индекс также перестраивается по истечении INGREDIENT_INDEX_TTL
+    секунд - так до других воркеров доходят изменения из админки
+    и команды import_ingredients.
+    """
+    global _index, _built_at
+    index = _index
+    if index_expired(index):
+        with _lock:
+            if _index is index:
+                _index = IngredientIndex(
+                    Ingredient.objects.values('id', 'name', 'measurement_unit')
+                )
+                _built_at = time.monotonic()
+            index = _index
+    return index
+
+
+def index_expired(index):
+    return index is None or time.monotonic() - _built_at > (
+        settings.INGREDIENT_INDEX_TTL
+    )
+
+
+async def aget_index():
+    """get_index для асинхронных вьюх: индекс строится в потоке."""
+    index = _index
+    if index_expired(index):
+        return await sync_to_async(get_index)()
+    return index
+
+
+def invalidate_index():
+    """Сбрасывает индекс, следующий запрос построит его заново."""
+    global _index
+    with _lock:
+        _index = None
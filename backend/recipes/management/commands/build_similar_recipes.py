@@ -0,0 +1,43 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from foodgram.constants import SIMILAR_RECIPES_COUNT
+from recipes.similarity import build_similar_recipes
+
+
+class Command(BaseCommand):
+    help = ('Рассчитывает похожие рецепты по общему избранному, корзинам '
+            'и ингредиентам и сохраняет их в таблицу рекомендаций.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Пересчитать только рецепты, у которых изменились '
+                 'избранное или корзины.'
+        )
+        parser.add_argument('--top-k', type=int, default=SIMILAR_RECIPES_COUNT)
+        parser.add_argument(
+            '--block-size', type=int, default=128,
+            help='Рецептов в блоке расчета; память - block-size x число '
+                 'рецептов x 4 байта.'
+        )
+        parser.add_argument(
+            '--ingredient-weight', type=float, default=0.3,
+            help='Доля сходства по ингредиентам в оценке, от 0 до 1.'
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['ingredient_weight'] <= 1:
+            raise CommandError('--ingredient-weight должен быть от 0 до 1.')
+        if options['top_k'] < 1 or options['block_size'] < 1:
+            raise CommandError('--top-k и --block-size должны быть больше 0.')
+        start = time.perf_counter()
+        count = build_similar_recipes(
+            options['top_k'], options['block_size'],
+            options['ingredient_weight'], options['incremental']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты пересчитаны для {count} рецептов '
+            f'за {time.perf_counter() - start:.1f} с.'
+        ))
@@ -0,0 +1,61 @@
+from django.core.management import BaseCommand
+from django.db.models import Q
+
+from foodgram.constants import AVATAR_RENDITIONS, RECIPE_IMAGE_RENDITIONS
+from foodgram.renditions import generate_renditions, mark_rendered
+from recipes.fragments import invalidate_recipe_fragments
+from recipes.models import Recipe, User
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии фото рецептов и аватаров.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать уже существующие копии.'
+        )
+
+    def generate(self, queryset, field, renditions, force):
+        """Копии для всех файлов поля, возвращает id обновленных объектов.
+
+        Копии одного файла, общего для нескольких объектов, создаются
+        один раз; готовность отмечается у каждого объекта.
+        """
+        changed = []
+        done = {}
+        for pk, name in queryset.values_list('pk', field).iterator():
+            if name not in done:
+                try:
+                    done[name] = generate_renditions(
+                        name, renditions, force=force
+                    )
+                except Exception as error:
+                    done[name] = None
+                    self.failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                self.created += done[name] or 0
+            if done[name] is None:
+                continue
+            marked = mark_rendered(queryset.model, pk, field, name)
+            if done[name] or marked:
+                changed.append(pk)
+        return changed
+
+    def handle(self, *args, **options):
+        self.created = self.failed = 0
+        recipes = self.generate(
+            Recipe.objects.exclude(image=''), 'image',
+            RECIPE_IMAGE_RENDITIONS, options['force']
+        )
+        authors = self.generate(
+            User.objects.exclude(avatar='').exclude(avatar=None), 'avatar',
+            AVATAR_RENDITIONS, options['force']
+        )
+        invalidate_recipe_fragments(
+            Recipe.objects.filter(Q(pk__in=recipes) | Q(author__in=authors))
+            .values_list('pk', flat=True)
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано копий: {self.created}, ошибок: {self.failed}.'
+        ))
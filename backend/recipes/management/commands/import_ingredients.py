@@ -0,0 +1,136 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from recipes.ingredient_index import invalidate_index
+from recipes.models import Ingredient
+
+
+READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row
+
+
+def read_json_objects(file):
+    """Построчно читает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(READ_SIZE)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON-массив.')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError('Некорректный JSON.')
+                break
+            yield item
+        buffer = buffer[position:]
+        if not chunk:
+            return
+
+
+def read_json(file):
+    """Элемент, который не является объектом со строковыми полями,
+    возвращается пустой строкой и считается строкой с ошибкой.
+    """
+    for item in read_json_objects(file):
+        fields = [
+            item.get('name'), item.get('measurement_unit')
+        ] if isinstance(item, dict) else []
+        yield fields if all(isinstance(field, str) for field in fields) else []
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+class Command(BaseCommand):
+    help = 'Загрузка ингредиентов из csv- или json-файла.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=settings.BASE_DIR / 'ingredients.csv',
+            help='Путь к файлу ingredients.csv или ingredients.json.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Проверить файл и посчитать новые строки без записи в БД.'
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        dry_run = options['dry_run']
+        rows = inserted = invalid = 0
+        # Новые пары (name, unit) из прошлых пачек: при --dry-run
+        # дубликат в другой пачке не должен считаться новым еще раз.
+        seen = set()
+        initial_count = Ingredient.objects.count()
+        start = time.perf_counter()
+        with open(path, encoding='utf-8') as file:
+            records = reader(file)
+            while batch := list(islice(records, options['batch_size'])):
+                rows += len(batch)
+                ingredients = {}
+                for record in batch:
+                    if len(record) < 2 or not record[0] or not record[1]:
+                        invalid += 1
+                        continue
+                    name, unit = record[0].strip(), record[1].strip()
+                    ingredients[(name, unit)] = Ingredient(
+                        name=name, measurement_unit=unit
+                    )
+                if dry_run:
+                    existing = set(
+                        Ingredient.objects
+                        .filter(name__in={name for name, _ in ingredients})
+                        .values_list('name', 'measurement_unit')
+                    )
+                    new = ingredients.keys() - existing - seen
+                    inserted += len(new)
+                    seen |= new
+                else:
+                    Ingredient.objects.bulk_create(
+                        ingredients.values(), ignore_conflicts=True
+                    )
+        elapsed = time.perf_counter() - start
+        if not dry_run:
+            inserted = Ingredient.objects.count() - initial_count
+            invalidate_index()
+        skipped = rows - inserted - invalid
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Проверено" if dry_run else "Загружено"}: {rows} строк '
+            f'за {elapsed:.2f} с ({rows / max(elapsed, 1e-9):.0f} строк/с). '
+            f'Новых: {inserted}, пропущено: {skipped}, '
+            f'с ошибками: {invalid}.'
+        ))
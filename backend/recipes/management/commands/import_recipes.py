@@ -0,0 +1,65 @@
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from recipes.serializers import RecipeCreateSerializer
+from users.models import User
+from .import_ingredients import read_json_objects
+
+
+class Command(BaseCommand):
+    help = (
+        'Пакетная загрузка рецептов из json-файла. Формат рецепта тот же, '
+        'что в API: name, text, cooking_time, tags, ingredients и image '
+        '(base64).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к json-файлу с рецептами.')
+        parser.add_argument(
+            '--author', required=True,
+            help='Имя пользователя или email автора рецептов.'
+        )
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только проверить рецепты, ничего не записывая в БД.'
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        author = User.objects.filter(
+            Q(username=options['author']) | Q(email=options['author'])
+        ).first()
+        if author is None:
+            raise CommandError(f'Пользователь {options["author"]} не найден.')
+        dry_run = options['dry_run']
+        rows = 0
+        start = time.perf_counter()
+        # Файл загружается целиком или не загружается вовсе.
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            records = read_json_objects(file)
+            while batch := list(islice(records, options['batch_size'])):
+                serializer = RecipeCreateSerializer(data=batch, many=True)
+                if not serializer.is_valid():
+                    raise CommandError('\n'.join(
+                        f'Рецепт {rows + number + 1}: '
+                        f'{json.dumps(errors, ensure_ascii=False)}'
+                        for number, errors in enumerate(serializer.errors)
+                        if errors
+                    ))
+                if not dry_run:
+                    serializer.save(author=author)
+                rows += len(batch)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Проверено" if dry_run else "Загружено"}: {rows} рецептов '
+            f'за {elapsed:.2f} с ({rows / max(elapsed, 1e-9):.0f} рецептов/с).'
+        ))
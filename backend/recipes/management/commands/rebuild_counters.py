@@ -0,0 +1,65 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from recipes.models import Favorited, Recipe, ShoppingCart
+from users.models import Follow, User
+
+
+# Счетчик: (модель, поле) -> (модель связи, поле связи с моделью).
+COUNTERS = {
+    (Recipe, 'favorites_count'): (Favorited, 'recipe'),
+    (Recipe, 'in_carts_count'): (ShoppingCart, 'recipe'),
+    (User, 'recipes_count'): (Recipe, 'author'),
+    (User, 'followers_count'): (Follow, 'following'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счетчики рецептов и пользователей с данными '
+            'и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только проверить расхождения, не меняя счетчики.'
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        fixed = 0
+        for (model, field), (related_model, related_field) in (
+            COUNTERS.items()
+        ):
+            expected = dict(
+                related_model.objects
+                .values_list(related_field)
+                .annotate(total=Count('pk'))
+                .order_by()
+            )
+            stored = dict(
+                model.objects.exclude(**{field: 0}).values_list('pk', field)
+            )
+            wrong = {
+                pk for pk in expected.keys() | stored.keys()
+                if expected.get(pk, 0) != stored.get(pk, 0)
+            }
+            self.stdout.write(
+                f'{model._meta.model_name}.{field}: '
+                f'расхождений {len(wrong)}.'
+            )
+            for pk in sorted(wrong):
+                self.stdout.write(
+                    f'  {pk}: {stored.get(pk, 0)} вместо {expected.get(pk, 0)}'
+                )
+            if options['dry_run'] or not wrong:
+                continue
+            objects = list(model.objects.filter(pk__in=wrong).only('pk'))
+            for obj in objects:
+                setattr(obj, field, expected.get(obj.pk, 0))
+            model.objects.bulk_update(objects, [field], batch_size=1000)
+            fixed += len(wrong)
+        if fixed:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено счетчиков: {fixed}.'
+            ))
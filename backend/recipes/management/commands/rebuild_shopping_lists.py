@@ -0,0 +1,54 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+from recipes.shopping_cart import aggregate_shopping_lists
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает предрассчитанные списки покупок по корзинам '
+            'и сообщает о расхождениях.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только проверить расхождения, не меняя таблицу.'
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        expected = {
+            (user, ingredient): amount
+            for user, ingredient, amount in aggregate_shopping_lists()
+        }
+        stored = {
+            (user, ingredient): amount
+            for user, ingredient, amount in ShoppingListItem.objects
+            .values_list('user_id', 'ingredient_id', 'amount')
+        }
+        missing = expected.keys() - stored.keys()
+        extra = stored.keys() - expected.keys()
+        wrong = {
+            key for key in expected.keys() & stored.keys()
+            if expected[key] != stored[key]
+        }
+        self.stdout.write(
+            f'Строк: {len(expected)}. Отсутствует: {len(missing)}, '
+            f'лишних: {len(extra)}, с неверным количеством: {len(wrong)}.'
+        )
+        for user, ingredient in sorted(missing | extra | wrong):
+            self.stdout.write(
+                f'  пользователь {user}, ингредиент {ingredient}: '
+                f'{stored.get((user, ingredient))} вместо '
+                f'{expected.get((user, ingredient))}'
+            )
+        if options['dry_run'] or not (missing or extra or wrong):
+            return
+        ShoppingListItem.objects.all().delete()
+        ShoppingListItem.objects.bulk_create(
+            (ShoppingListItem(user_id=user, ingredient_id=ingredient,
+                              amount=amount)
+             for (user, ingredient), amount in expected.items()),
+            batch_size=1000
+        )
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны.'))
@@ -0,0 +1,33 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe, Tag
+from recipes.tag_masks import invalidate_tags, update_tags_masks
+
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Назначает биты тегам без бита и пересчитывает маски тегов '
+            'всех рецептов.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        for tag in Tag.objects.filter(bit=None).order_by('pk'):
+            tag.save()
+            if tag.bit is None:
+                self.stdout.write(self.style.WARNING(
+                    f'Тегу {tag.slug} не хватило бита, фильтр по нему '
+                    'работает через таблицу связей.'
+                ))
+        invalidate_tags()
+        recipe_ids = Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        total = 0
+        for start in range(0, recipe_ids.count(), BATCH_SIZE):
+            batch = list(recipe_ids[start:start + BATCH_SIZE])
+            update_tags_masks(batch)
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Маски тегов пересчитаны для {total} рецептов.'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.timeline import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает ленты подписок по текущим подпискам, например '
+            'после seed или импорта рецептов без рассылки по лентам.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        entries = rebuild_timelines()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты подписок пересобраны, записей: {entries}.'
+        ))
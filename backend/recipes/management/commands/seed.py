@@ -0,0 +1,342 @@
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connections, router, transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from PIL import Image
+
+from recipes.models import (Favorited, Ingredient, Recipe, RecipeIngredients,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+from .rebuild_counters import COUNTERS
+
+
+PLACEHOLDER_IMAGE = 'recipes/seed_placeholder.jpg'
+# Строк в одном INSERT: держит число параметров в пределах лимита SQLite.
+INSERT_BATCH_SIZE = 500
+DEFAULT_TAGS = (('Завтрак', 'breakfast'), ('Обед', 'lunch'),
+                ('Ужин', 'dinner'))
+WORDS = (
+    'суп', 'салат', 'паста', 'пирог', 'соус', 'рагу', 'запеканка', 'каша',
+    'курица', 'говядина', 'рыба', 'грибы', 'овощи', 'сыр', 'томаты',
+    'картофель', 'капуста', 'тыква', 'фасоль', 'рис', 'по-домашнему',
+    'острый', 'сливочный', 'быстрый', 'летний', 'пряный', 'нежный',
+)
+
+
+def int_range(value):
+    """Диапазон вида "3-15" или одно число."""
+    low, _, high = value.partition('-')
+    try:
+        low, high = int(low), int(high or low)
+    except ValueError:
+        raise CommandError(f'Ожидается диапазон вида 3-15, получено {value}.')
+    if low < 0 or low > high:
+        raise CommandError(f'Некорректный диапазон {value}.')
+    return low, high
+
+
+class PowerLaw:
+    """Выбор элементов с вероятностью, убывающей по степенному закону.
+
+    Ранги раздаются в случайном порядке, поэтому популярность
+    не связана с id. alpha=0 - равномерное распределение.
+    """
+
+    def __init__(self, population, alpha, rng):
+        self.population = list(population)
+        rng.shuffle(self.population)
+        self.cum_weights = list(accumulate(
+            1 / (rank + 1) ** alpha for rank in range(len(self.population))
+        ))
+        self.rng = rng
+
+    def sample(self, k):
+        return self.rng.choices(
+            self.population, cum_weights=self.cum_weights, k=k
+        )
+
+
+@contextmanager
+def explicit_created_at():
+    """Разрешает задать created_at при вставке вместо текущего времени."""
+    field = Recipe._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def insert_rows(model, fields, rows, ignore_conflicts=False):
+    """Вставка кортежей в таблицу связей многострочными INSERT.
+
+    Для таблиц из одних внешних ключей создание объектов моделей
+    и сборка SQL в bulk_create занимают больше времени, чем сама
+    вставка.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(model._meta.get_field(field).column) for field in fields
+    )
+    row_sql = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    rows = iter(rows)
+    with transaction.atomic(using=connection.alias), connection.cursor() as (
+        cursor
+    ):
+        while batch := list(islice(rows, INSERT_BATCH_SIZE)):
+            sql = (
+                f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+                f'VALUES {", ".join([row_sql] * len(batch))}'
+            )
+            if ignore_conflicts:
+                sql += ' ON CONFLICT DO NOTHING'
+            cursor.execute(sql, [value for row in batch for value in row])
+
+
+def chunks(total, size):
+    for start in range(0, total, size):
+        yield min(size, total - start)
+
+
+class Command(BaseCommand):
+    help = ('Заполняет БД синтетическими пользователями, рецептами, '
+            'подписками, избранным и корзинами для нагрузочных замеров.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--follows', type=int, default=5000)
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=5000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int_range, default=(3, 15),
+            metavar='MIN-MAX'
+        )
+        parser.add_argument(
+            '--tags-per-recipe', type=int_range, default=(1, 3),
+            metavar='MIN-MAX'
+        )
+        parser.add_argument(
+            '--author-alpha', type=float, default=1.1,
+            help='Показатель степенного закона числа рецептов у авторов.'
+        )
+        parser.add_argument(
+            '--follow-alpha', type=float, default=1.1,
+            help='Показатель степенного закона популярности авторов '
+                 'среди подписчиков.'
+        )
+        parser.add_argument(
+            '--recipe-alpha', type=float, default=1.0,
+            help='Показатель степенного закона популярности рецептов '
+                 'в избранном и корзинах.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределить даты рецептов.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.prefix = f'seed{options["seed"]}_'
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(
+                f'Данные с --seed {options["seed"]} уже загружены.'
+            )
+        self.ingredients = list(
+            Ingredient.objects.values_list('pk', flat=True)
+        )
+        if not self.ingredients:
+            raise CommandError(
+                'Справочник ингредиентов пуст, сначала выполните '
+                'import_ingredients.'
+            )
+        self.tags = self.get_tags()
+        start = time.perf_counter()
+        users = self.stage('Пользователи', self.create_users)
+        recipes = self.stage('Рецепты', self.create_recipes, users)
+        self.stage('Подписки', self.create_follows, users)
+        self.stage(
+            'Избранное', self.create_user_recipes, Favorited, users, recipes,
+            options['favorites'], 'favorites'
+        )
+        self.stage(
+            'Корзины', self.create_user_recipes, ShoppingCart, users,
+            recipes, options['carts'], 'carts'
+        )
+        self.stage('Счетчики', self.update_counters)
+        self.stage(
+            'Списки покупок', call_command, 'rebuild_shopping_lists',
+            stdout=io.StringIO()
+        )
+        self.stage(
+            'Ленты подписок', call_command, 'rebuild_timelines',
+            stdout=io.StringIO()
+        )
+        self.stage(
+            'Похожие рецепты', call_command, 'build_similar_recipes',
+            stdout=io.StringIO()
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - start:.1f} с.'
+        ))
+
+    def stage(self, title, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        rows = f', строк: {len(result)}' if isinstance(result, list) else ''
+        self.stdout.write(f'{title}: {elapsed:.1f} с{rows}.')
+        return result
+
+    def rng(self, name):
+        return random.Random(f'{self.options["seed"]}-{name}')
+
+    def pick(self, rng, population, option):
+        """Случайные элементы в количестве из диапазона option."""
+        count = rng.randint(*self.options[option])
+        return rng.sample(population, min(len(population), count))
+
+    def get_tags(self):
+        if not Tag.objects.exists():
+            for name, slug in DEFAULT_TAGS:
+                Tag.objects.create(name=name, slug=slug)
+        return list(Tag.objects.values_list('pk', 'bit'))
+
+    def create_users(self):
+        ids = []
+        for number, size in enumerate(
+            chunks(self.options['users'], self.options['chunk_size'])
+        ):
+            offset = number * self.options['chunk_size']
+            ids += [user.pk for user in User.objects.bulk_create(
+                User(
+                    username=f'{self.prefix}{i}',
+                    email=f'{self.prefix}{i}@example.com',
+                    first_name='Пользователь',
+                    last_name=str(i),
+                    # Вход под такими пользователями невозможен.
+                    password='!seed',
+                )
+                for i in range(offset, offset + size)
+            )]
+        return ids
+
+    def placeholder_image(self):
+        if not default_storage.exists(PLACEHOLDER_IMAGE):
+            buffer = io.BytesIO()
+            Image.new('RGB', (600, 400), (230, 200, 160)).save(buffer, 'JPEG')
+            default_storage.save(
+                PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue())
+            )
+        return PLACEHOLDER_IMAGE
+
+    def create_recipes(self, users):
+        rng = self.rng('recipes')
+        authors = PowerLaw(users, self.options['author_alpha'], rng)
+        image = self.placeholder_image()
+        now = timezone.now()
+        period = timedelta(days=self.options['days']).total_seconds()
+        ids = []
+        for size in chunks(self.options['recipes'],
+                           self.options['chunk_size']):
+            tags = [
+                self.pick(rng, self.tags, 'tags_per_recipe')
+                for _ in range(size)
+            ]
+            with explicit_created_at():
+                recipes = Recipe.objects.bulk_create(
+                    Recipe(
+                        author_id=author,
+                        name=' '.join(rng.sample(WORDS, 3)).capitalize(),
+                        text=' '.join(rng.choices(WORDS, k=40)),
+                        cooking_time=rng.randint(5, 180),
+                        image=image,
+                        created_at=now - timedelta(
+                            seconds=rng.random() * period
+                        ),
+                        tags_mask=sum(
+                            1 << bit for _, bit in recipe_tags
+                            if bit is not None
+                        ),
+                    )
+                    for author, recipe_tags in zip(authors.sample(size), tags)
+                )
+            insert_rows(
+                RecipeIngredients, ('recipe', 'ingredient', 'amount'),
+                (
+                    (recipe.pk, ingredient, rng.randint(1, 500))
+                    for recipe in recipes
+                    for ingredient in self.pick(
+                        rng, self.ingredients, 'ingredients_per_recipe'
+                    )
+                )
+            )
+            insert_rows(
+                Recipe.tags.through, ('recipe', 'tag'),
+                (
+                    (recipe.pk, tag)
+                    for recipe, recipe_tags in zip(recipes, tags)
+                    for tag, _ in recipe_tags
+                )
+            )
+            ids += [recipe.pk for recipe in recipes]
+        return ids
+
+    def create_follows(self, users):
+        rng = self.rng('follows')
+        following = PowerLaw(users, self.options['follow_alpha'], rng)
+        for size in chunks(self.options['follows'],
+                           self.options['chunk_size']):
+            insert_rows(
+                Follow, ('user', 'following'),
+                (
+                    (user, author) for user, author in zip(
+                        rng.choices(users, k=size), following.sample(size)
+                    )
+                    if user != author
+                ),
+                ignore_conflicts=True
+            )
+
+    def create_user_recipes(self, model, users, recipes, total, name):
+        """Избранное или корзины: рецепты по степенному закону."""
+        if not recipes:
+            return 0
+        rng = self.rng(name)
+        popular = PowerLaw(recipes, self.options['recipe_alpha'], rng)
+        for size in chunks(total, self.options['chunk_size']):
+            insert_rows(
+                model, ('user', 'recipe'),
+                zip(rng.choices(users, k=size), popular.sample(size)),
+                ignore_conflicts=True
+            )
+
+    def update_counters(self):
+        """Счетчики одним UPDATE на каждый, без обхода строк в Python."""
+        for (model, field), (related_model, related_field) in (
+            COUNTERS.items()
+        ):
+            model.objects.update(**{field: Coalesce(
+                Subquery(
+                    related_model.objects
+                    .filter(**{related_field: OuterRef('pk')})
+                    .order_by()
+                    .values(related_field)
+                    .annotate(total=Count('pk'))
+                    .values('total')
+                ),
+                Value(0)
+            )})
@@ -1,12 +1,14 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
 
-from foodgram.constants import (TAG_MAX_LENGTH,
+from foodgram.constants import (IMAGE_NAME_MAX_LENGTH,
                                 INGREDIENT_NAME_MAX_LENGTH,
                                 MEASUREMENT_UNIT_MAX_LENGTH,
                                 RECIPE_NAME_MAX_LENGTH,
-                                SHORT_LINK_MAX_LENGTH)
+                                SHORT_LINK_MAX_LENGTH, TAG_BIT_ATTEMPTS,
+                                TAG_MASK_BITS, TAG_MAX_LENGTH)
+from foodgram.counters import DenormalizedFieldsMixin
 
 
 User = get_user_model()
@@ -25,6 +27,13 @@ class Tag(models.Model):
         unique=True,
         verbose_name='Слаг тега',
         help_text='Идентификаторы тегов.')
+    bit = models.PositiveSmallIntegerField(
+        unique=True,
+        null=True,
+        editable=False,
+        verbose_name='Бит тега',
+        help_text='Номер бита тега в маске тегов рецепта.'
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -33,6 +42,32 @@ class Tag(models.Model):
     def __str__(self):
         return self.slug
 
+    def save(self, *args, **kwargs):
+        """Новый тег получает наименьший свободный бит.
+
+        Два тега, созданные одновременно, могут выбрать один бит:
+        второй упрется в уникальность bit и выберет бит заново.
+        """
+        if self.bit is not None:
+            return super().save(*args, **kwargs)
+        for attempt in range(TAG_BIT_ATTEMPTS):
+            used = set(
+                Tag.objects.exclude(bit=None).values_list('bit', flat=True)
+            )
+            self.bit = min(set(range(TAG_MASK_BITS)) - used, default=None)
+            if self.bit is None:
+                return super().save(*args, **kwargs)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                taken = Tag.objects.filter(bit=self.bit).exclude(
+                    pk=self.pk
+                ).exists()
+                self.bit = None
+                if not taken or attempt == TAG_BIT_ATTEMPTS - 1:
+                    raise
+
 
 class Ingredient(models.Model):
     """Модель ингредиента."""
@@ -51,9 +86,14 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'], name='unique_ingredient'
+            )
+        ]
 
 
-class Recipe(models.Model):
+class Recipe(DenormalizedFieldsMixin, models.Model):
     """Модель рецепта."""
     name = models.CharField(
         max_length=RECIPE_NAME_MAX_LENGTH,
@@ -91,11 +131,24 @@ class Recipe(models.Model):
         verbose_name='Изображение',
         help_text='Фото блюда в формате jpg/png.'
     )
+    rendered_image = models.CharField(
+        max_length=IMAGE_NAME_MAX_LENGTH,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Фото с готовыми копиями',
+        help_text='Файл фото, для которого созданы уменьшенные копии.'
+    )
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата и время создания рецепта',
         help_text='Дата и время создания рецепта.'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата и время изменения рецепта',
+        help_text='Дата и время последнего изменения рецепта.'
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         through='RecipeIngredients',
@@ -111,11 +164,56 @@ class Recipe(models.Model):
         verbose_name='Короткая ссылка',
         help_text='Короткая ссылка на рецепт.'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+        help_text='Сколько пользователей добавили рецепт в избранное.'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзинах',
+        help_text='Сколько пользователей добавили рецепт в корзину.'
+    )
+    tags_mask = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Маска тегов',
+        help_text='Биты тегов рецепта для фильтрации без JOIN.'
+    )
+    fanned_out = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='В лентах подписчиков',
+        help_text='Рецепт записан в ленты подписчиков автора.'
+    )
+    similar_stale = models.BooleanField(
+        default=True,
+        editable=False,
+        verbose_name='Пересчитать похожие',
+        help_text='Избранное или корзины изменились после расчета '
+                  'похожих рецептов.'
+    )
+    denormalized_fields = (
+        'favorites_count', 'in_carts_count', 'tags_mask', 'fanned_out',
+        'similar_stale', 'rendered_image'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ('-created_at',)
+        ordering = ('-created_at', '-id')
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'], name='recipe_created_at_id_idx'
+            ),
+            # Лента подписок: рецепты авторов по убыванию даты.
+            models.Index(
+                fields=['author', '-created_at', '-id'],
+                name='recipe_author_created_at_idx'
+            ),
+        ]
 
 
 class RecipeIngredients(models.Model):
@@ -182,3 +280,103 @@ class ShoppingCart(models.Model):
                 fields=['user', 'recipe'], name='unique_shopping_cart'
             )
         ]
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в корзине пользователя.
+
+    Таблица поддерживается при изменении корзины и состава рецептов,
+    чтобы список покупок читался одним запросом.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, related_name='shopping_lists'
+    )
+    amount = models.IntegerField()
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'], name='unique_shopping_list_item'
+            )
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя.
+
+    Строки добавляются при публикации рецепта и при подписке на автора
+    и удаляются при отписке, чтобы лента читалась по индексу без JOIN
+    подписок с рецептами. Рецепты авторов с большим числом подписчиков
+    в ленты не записываются (fanned_out=False) и читаются при запросе.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='timeline'
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+'
+    )
+    created_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at', '-recipe'],
+                name='timeline_user_created_at_idx'
+            )
+        ]
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт на месте rank в рекомендациях к рецепту.
+
+    Таблицу заполняет команда build_similar_recipes, рекомендации
+    рецепта читаются одним запросом по индексу (recipe, rank).
+    """
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='similar_recipes'
+    )
+    similar = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='similar_to'
+    )
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'rank'], name='unique_similar_recipe_rank'
+            )
+        ]
+
+
+class RecipeSearchEntry(models.Model):
+    """Строка таблицы полнотекстового поиска FTS5 на SQLite.
+
+    Таблицу создает recipes.search.setup_search; модель нужна, чтобы
+    присоединить ее к запросу рецептов по rowid.
+    """
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column='rowid', db_constraint=False, related_name='search_entry'
+    )
+
+    class Meta:
+        managed = False
+        db_table = 'recipes_recipe_fts'
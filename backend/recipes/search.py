@@ -0,0 +1,123 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe, RecipeSearchEntry
+
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = RecipeSearchEntry._meta.db_table
+# Вес совпадений в названии относительно описания.
+NAME_WEIGHT = 10.0
+
+SETUP_SQL = {
+    # Вектор хранится в генерируемой колонке, поэтому PostgreSQL сам
+    # пересчитывает его при любом изменении названия или описания.
+    'postgresql': [
+        f"""
+        ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS search_vector
+        tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(name, '')), 'A')
+            || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(text, '')),
+                         'B')
+        ) STORED
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS recipe_search_vector_idx
+        ON recipes_recipe USING gin (search_vector)
+        """,
+    ],
+    # Таблица FTS5 без копии данных, синхронизируется триггерами.
+    # Миграции на SQLite пересоздают таблицу рецептов вместе с ее
+    # триггерами, поэтому после каждой миграции индекс перестраивается.
+    'sqlite': [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            name, text, content='recipes_recipe', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+        AFTER INSERT ON recipes_recipe BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+        AFTER DELETE ON recipes_recipe BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+            VALUES ('delete', old.id, old.name, old.text);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+        AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+            VALUES ('delete', old.id, old.name, old.text);
+            INSERT INTO {FTS_TABLE}(rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+        """,
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+    ],
+}
+
+
+def setup_search(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Создает поисковый индекс рецептов; вызывается после миграций."""
+    connection = connections[using]
+    statements = SETUP_SQL.get(connection.vendor)
+    if not statements:
+        return
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, от более релевантных к менее.
+
+    На PostgreSQL используется колонка search_vector с GIN-индексом,
+    на SQLite - таблица FTS5, на остальных СУБД - icontains без ранжирования.
+    """
+    connection = connections[queryset.db]
+    table = connection.ops.quote_name(Recipe._meta.db_table)
+    if connection.vendor == 'postgresql':
+        tsquery = 'websearch_to_tsquery(%s, %s)'
+        params = (SEARCH_CONFIG, query)
+        condition = RawSQL(
+            f'{table}.search_vector @@ {tsquery}', params,
+            output_field=BooleanField()
+        )
+        rank = RawSQL(
+            f'ts_rank_cd({table}.search_vector, {tsquery})', params,
+            output_field=FloatField()
+        )
+    elif connection.vendor == 'sqlite':
+        words = re.findall(r'\w+', query)
+        if not words:
+            return queryset.none()
+        # Каждое слово ищется как префикс, все слова обязательны.
+        match = ' '.join(f'"{word}"*' for word in words)
+        # Таблица FTS5 присоединяется к запросу, а не опрашивается
+        # подзапросом для каждой строки: bm25 собирает статистику
+        # по всем совпадениям, и в подзапросе это повторялось бы
+        # для каждого рецепта.
+        queryset = queryset.filter(search_entry__isnull=False)
+        condition = RawSQL(
+            f'{FTS_TABLE} MATCH %s', (match,), output_field=BooleanField()
+        )
+        rank = RawSQL(
+            f'-bm25({FTS_TABLE}, {NAME_WEIGHT}, 1.0)', (),
+            output_field=FloatField()
+        )
+    else:
+        condition = Q(name__icontains=query) | Q(text__icontains=query)
+        rank = Value(0.0)
+    return queryset.filter(condition).annotate(search_rank=rank).order_by(
+        '-search_rank', *Recipe._meta.ordering
+    )
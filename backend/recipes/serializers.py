@@ -1,11 +1,24 @@
+from collections import Counter
+from functools import partial
+
 from django.db import transaction
-from drf_extra_fields.fields import Base64ImageField
+from django.db.models import Prefetch
 from rest_framework import serializers
 
 
+from foodgram.constants import AVATAR_RENDITIONS, RECIPE_IMAGE_RENDITIONS
+from foodgram.counters import change_counter
+from foodgram.renditions import RenditionsField, schedule_renditions
+from foodgram.uploads import UploadImageField
+from users.models import Follow, User
 from users.serializers import UserSerializer
+from .fragments import (aget_recipe_fragments, get_recipe_fragments,
+                        invalidate_recipe_fragments)
 from .models import (Ingredient, Recipe, RecipeIngredients,
                      Tag, Favorited, ShoppingCart)
+from .shopping_cart import lock_recipe, update_recipe_carts
+from .tag_masks import update_tags_masks
+from .timeline import fan_out_recipes
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -13,7 +26,7 @@ class TagSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Tag
-        fields = '__all__'
+        fields = ('id', 'name', 'slug')
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -37,29 +50,167 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор для рецептов."""
+class RecipeAuthorSerializer(serializers.ModelSerializer):
+    """Не зависящие от пользователя данные автора рецепта."""
+    avatar = serializers.ImageField(read_only=True)
+    avatar_renditions = RenditionsField(AVATAR_RENDITIONS, source='avatar')
+
+    class Meta:
+        model = User
+        fields = ('email', 'id', 'username', 'first_name',
+                  'last_name', 'avatar', 'avatar_renditions')
+
+
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """Часть рецепта, одинаковая для всех пользователей.
+
+    Сериализуется без запроса, поэтому ссылки на изображения
+    относительные, и результат можно хранить в кэше.
+    """
     tags = TagSerializer(many=True)
-    author = UserSerializer(read_only=True)
+    author = RecipeAuthorSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
     image = serializers.ImageField(read_only=True)
+    image_renditions = RenditionsField(
+        RECIPE_IMAGE_RENDITIONS, source='image'
+    )
 
     class Meta:
-        abstract = True
         model = Recipe
-        fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image',
-                  'text', 'cooking_time')
+        fields = ('id', 'tags', 'author', 'ingredients', 'name', 'image',
+                  'image_renditions', 'text', 'cooking_time')
 
     def get_ingredients(self, obj):
         """Получение списка ингредиентов для рецепта."""
         recipe_ingredients = obj.recipe_ingredients.all()
         return RecipeIngredientSerializer(recipe_ingredients, many=True).data
 
+
+def build_recipe_fragments(recipe_ids):
+    """Сериализует фрагменты рецептов, которых не оказалось в кэше."""
+    recipes = Recipe.objects.filter(pk__in=recipe_ids).select_related(
+        'author'
+    ).prefetch_related(
+        'tags',
+        Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredients.objects.select_related('ingredient')
+        )
+    )
+    return {
+        fragment['id']: fragment
+        for fragment in RecipeFragmentSerializer(recipes, many=True).data
+    }
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов: все фрагменты читаются из кэша одним обращением."""
+
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        fragments = get_recipe_fragments(
+            [recipe.pk for recipe in recipes],
+            build_recipe_fragments,
+            self.context.get('fragment_stats')
+        )
+        return self.merge_fragments(recipes, fragments)
+
+    async def ato_representation(self, recipes):
+        """to_representation для уже загруженного списка рецептов."""
+        fragments = await aget_recipe_fragments(
+            [recipe.pk for recipe in recipes],
+            build_recipe_fragments,
+            self.context.get('fragment_stats')
+        )
+        return self.merge_fragments(recipes, fragments)
+
+    def merge_fragments(self, recipes, fragments):
+        return [
+            self.child.merge_fragment(recipe, fragments[recipe.pk])
+            for recipe in recipes if recipe.pk in fragments
+        ]
+
+
+class RecipeSerializer(RecipeFragmentSerializer):
+    """Сериализатор для рецептов.
+
+    Общая часть рецепта берется из кэша фрагментов, а флаги
+    текущего пользователя добавляются к ней при каждом ответе.
+    """
+    author = UserSerializer(read_only=True)
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
+
+    class Meta:
+        abstract = True
+        model = Recipe
+        fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
+                  'is_in_shopping_cart', 'name', 'image', 'image_renditions',
+                  'text', 'cooking_time')
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        fragment = get_recipe_fragments(
+            [instance.pk],
+            build_recipe_fragments,
+            self.context.get('fragment_stats')
+        )[instance.pk]
+        return self.merge_fragment(instance, fragment)
+
+    async def ato_representation(self, instance):
+        fragment = (await aget_recipe_fragments(
+            [instance.pk],
+            build_recipe_fragments,
+            self.context.get('fragment_stats')
+        ))[instance.pk]
+        return self.merge_fragment(instance, fragment)
+
+    def merge_fragment(self, instance, fragment):
+        """Добавляет к фрагменту флаги пользователя и полные ссылки."""
+        author = dict(
+            fragment['author'],
+            avatar=self.absolute_url(fragment['author']['avatar']),
+            avatar_renditions=self.absolute_urls(
+                fragment['author']['avatar_renditions']
+            ),
+            is_subscribed=self.get_author_is_subscribed(instance)
+        )
+        data = dict(
+            fragment,
+            author={
+                field: author[field] for field in UserSerializer.Meta.fields
+            },
+            image=self.absolute_url(fragment['image']),
+            image_renditions=self.absolute_urls(fragment['image_renditions']),
+            is_favorited=self.get_is_favorited(instance),
+            is_in_shopping_cart=self.get_is_in_shopping_cart(instance)
+        )
+        return {field: data[field] for field in self.Meta.fields}
+
+    def absolute_url(self, url):
+        request = self.context.get('request')
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def absolute_urls(self, urls):
+        return {key: self.absolute_url(url) for key, url in urls.items()}
+
+    def get_author_is_subscribed(self, obj):
+        """Проверка подписки на автора рецепта."""
+        if hasattr(obj, 'author_is_subscribed'):
+            return obj.author_is_subscribed
+        user = self.context.get('request').user
+        if user.is_authenticated:
+            return Follow.objects.filter(
+                user=user, following_id=obj.author_id
+            ).exists()
+        return False
+
     def get_is_favorited(self, obj):
         """Проверка на наличие рецепта в избранном."""
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_authenticated:
             return Favorited.objects.filter(user=user, recipe=obj).exists()
@@ -67,6 +218,8 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_is_in_shopping_cart(self, obj):
         """Проверка на наличие рецепта в корзине."""
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_authenticated:
             return ShoppingCart.objects.filter(
@@ -75,6 +228,102 @@ class RecipeSerializer(serializers.ModelSerializer):
         return False
 
 
+def get_existing_ids(model, ids, context):
+    """Множество id из ids, которые есть в таблице model.
+
+    При пакетном создании id всех рецептов уже проверены одним
+    запросом на таблицу и лежат в контексте.
+    """
+    known = context.get('existing_ids', {}).get(model)
+    if known is None:
+        known = set(
+            model.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+    return known
+
+
+def collect_ids(values):
+    """id из еще не проверенных данных; некорректные пропускаются."""
+    ids = set()
+    for value in values:
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            pass
+    return ids
+
+
+class RecipeBulkCreateSerializer(serializers.ListSerializer):
+    """Пакетное создание рецептов.
+
+    Ингредиенты и теги всех рецептов проверяются двумя запросами,
+    а рецепты, их ингредиенты и теги вставляются через bulk_create
+    в одной транзакции.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            items = [item for item in data if isinstance(item, dict)]
+            ingredient_ids = collect_ids(
+                ingredient.get('id')
+                for item in items
+                for ingredient in item.get('ingredients') or ()
+                if isinstance(ingredient, dict)
+            )
+            tag_ids = collect_ids(
+                tag for item in items for tag in item.get('tags') or ()
+            )
+            self.context['existing_ids'] = {
+                Ingredient: set(Ingredient.objects.filter(
+                    id__in=ingredient_ids
+                ).values_list('id', flat=True)),
+                Tag: set(
+                    Tag.objects.filter(id__in=tag_ids)
+                    .values_list('id', flat=True)
+                ),
+            }
+        return super().to_internal_value(data)
+
+    @transaction.atomic
+    def create(self, validated_data):
+        recipes = Recipe.objects.bulk_create(
+            Recipe(**{
+                field: value for field, value in data.items()
+                if field not in ('ingredients', 'tags')
+            })
+            for data in validated_data
+        )
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
+                recipe=recipe,
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount']
+            )
+            for recipe, data in zip(recipes, validated_data)
+            for ingredient in data['ingredients']
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag)
+            for recipe, data in zip(recipes, validated_data)
+            for tag in data['tags']
+        )
+        update_tags_masks([recipe.pk for recipe in recipes])
+        fan_out_recipes(recipes)
+        # bulk_create не отправляет сигналы, поэтому маски тегов,
+        # счетчики рецептов авторов и уменьшенные копии фото
+        # обрабатываются здесь.
+        for author, count in Counter(
+            recipe.author_id for recipe in recipes
+        ).items():
+            change_counter(User, author, 'recipes_count', count)
+        for recipe in recipes:
+            schedule_renditions(
+                recipe, 'image', RECIPE_IMAGE_RENDITIONS,
+                on_done=partial(invalidate_recipe_fragments, [recipe.pk])
+            )
+        return recipes
+
+
 class RecipeCreateSerializer(RecipeSerializer):
     """Сериализатор для создания рецепта."""
     ingredients = serializers.ListField(
@@ -85,12 +334,13 @@ class RecipeCreateSerializer(RecipeSerializer):
         child=serializers.IntegerField(),
         required=True
     )
-    image = Base64ImageField(required=True)
+    image = UploadImageField(required=True)
 
     class Meta:
         model = Recipe
         fields = ('ingredients', 'tags', 'image',
                   'name', 'text', 'cooking_time')
+        list_serializer_class = RecipeBulkCreateSerializer
 
     def validate_ingredients(self, value):
         """Проверка на корректность добавленных
@@ -98,15 +348,13 @@ class RecipeCreateSerializer(RecipeSerializer):
         errors = []
         if not value:
             errors.append('Ингредиенты обязательны.')
-        unique_ingredients = set()
-        for ingredient in value:
-            if ingredient['id'] in unique_ingredients:
-                errors.append('Ингредиенты должы быть уникальными.')
-            unique_ingredients.add(ingredient['id'])
-            if ingredient['amount'] <= 0:
-                errors.append('Количество должно быть больше 0.')
-            if not Ingredient.objects.filter(id=ingredient['id']).exists():
-                errors.append('Ингредиента не существует.')
+        ids = [ingredient['id'] for ingredient in value]
+        if len(set(ids)) != len(ids):
+            errors.append('Ингредиенты должы быть уникальными.')
+        if any(ingredient['amount'] <= 0 for ingredient in value):
+            errors.append('Количество должно быть больше 0.')
+        if set(ids) - get_existing_ids(Ingredient, ids, self.context):
+            errors.append('Ингредиента не существует.')
         if errors:
             raise serializers.ValidationError(errors)
         return value
@@ -116,13 +364,10 @@ class RecipeCreateSerializer(RecipeSerializer):
         errors = []
         if not value:
             errors.append('Тэги обязательны.')
-        unique_tags = set()
-        for tag in value:
-            if tag in unique_tags:
-                errors.append('Тэги должы быть уникальными.')
-            unique_tags.add(tag)
-            if not Tag.objects.filter(id=tag).exists():
-                errors.append('Тэга не существует.')
+        if len(set(value)) != len(value):
+            errors.append('Тэги должы быть уникальными.')
+        if set(value) - get_existing_ids(Tag, value, self.context):
+            errors.append('Тэга не существует.')
         if errors:
             raise serializers.ValidationError(errors)
         return value
@@ -144,8 +389,44 @@ class RecipeCreateSerializer(RecipeSerializer):
         recipe = Recipe.objects.create(**validated_data)
         self.create_recipe_ingredients(recipe, ingredients)
         recipe.tags.set(tags)
+        fan_out_recipes([recipe])
         return recipe
 
+    def update_recipe_ingredients(self, recipe, ingredients):
+        """Изменяет только отличающиеся строки ингредиентов рецепта.
+
+        Возвращает изменения количества по ингредиентам.
+        """
+        current = {
+            row.ingredient_id: row
+            for row in RecipeIngredients.objects.filter(recipe=recipe)
+        }
+        amounts = {ingr['id']: ingr['amount'] for ingr in ingredients}
+        deltas = {
+            ingredient: amount - getattr(current.get(ingredient), 'amount', 0)
+            for ingredient, amount in amounts.items()
+        }
+        removed = current.keys() - amounts.keys()
+        deltas.update(
+            (ingredient, -current[ingredient].amount) for ingredient in removed
+        )
+        if removed:
+            RecipeIngredients.objects.filter(
+                recipe=recipe, ingredient__in=removed
+            ).delete()
+        changed = [
+            row for ingredient, row in current.items()
+            if deltas.get(ingredient) and ingredient in amounts
+        ]
+        for row in changed:
+            row.amount = amounts[row.ingredient_id]
+        RecipeIngredients.objects.bulk_update(changed, ['amount'])
+        self.create_recipe_ingredients(recipe, [
+            ingr for ingr in ingredients if ingr['id'] not in current
+        ])
+        return deltas
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients', None)
         tags = validated_data.pop('tags', None)
@@ -153,12 +434,29 @@ class RecipeCreateSerializer(RecipeSerializer):
             raise serializers.ValidationError('Тэги обязательны.')
         if not ingredients:
             raise serializers.ValidationError('Ингредиенты обязательны.')
-        RecipeIngredients.objects.filter(recipe=instance).delete()
-        self.create_recipe_ingredients(instance, ingredients)
-        instance.tags.set(tags)
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        lock_recipe(instance.pk)
+        deltas = self.update_recipe_ingredients(instance, ingredients)
+        # Удаленные строки вычитаются из списков покупок по сигналу
+        # post_delete, а bulk_update и bulk_create сигналов не отправляют.
+        update_recipe_carts(instance.pk, {
+            ingredient['id']: deltas[ingredient['id']]
+            for ingredient in ingredients
+        })
+        current_tags = set(instance.tags.values_list('id', flat=True))
+        if current_tags - set(tags):
+            instance.tags.remove(*(current_tags - set(tags)))
+        if set(tags) - current_tags:
+            instance.tags.add(*(set(tags) - current_tags))
+        update_fields = [
+            attr for attr, value in validated_data.items()
+            if getattr(instance, attr) != value
+        ]
+        for attr in update_fields:
+            setattr(instance, attr, validated_data[attr])
+        if update_fields or any(deltas.values()) or current_tags != set(tags):
+            # Сохранение обновляет updated_at и сбрасывает кэш фрагментов
+            # и в случае, когда изменились только ингредиенты или теги.
+            instance.save(update_fields=[*update_fields, 'updated_at'])
         return instance
 
 
@@ -166,9 +464,13 @@ class RecipeFavoriteShoppingCartSerializer(serializers.ModelSerializer):
     """Сериализатор для ответа при добавлении
     рецепта в избранное или корзину."""
 
+    image_renditions = RenditionsField(
+        RECIPE_IMAGE_RENDITIONS, source='image'
+    )
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
 
 
 class FavoritedSerializer(serializers.ModelSerializer):
@@ -0,0 +1,237 @@
+import csv
+import io
+import json
+import os
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Case, F, Sum, Value, When
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework import renderers
+
+from .models import (Recipe, RecipeIngredients, ShoppingCart,
+                     ShoppingListItem, User)
+
+
+CHUNK_SIZE = 500
+PDF_FONT_NAME = 'ShoppingCartFont'
+PDF_FALLBACK_FONT = 'Helvetica'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+PDF_BUFFER_SIZE = 64 * 1024
+
+
+def get_cart_ingredients(user):
+    """Список покупок пользователя из предрассчитанной таблицы."""
+    return (
+        ShoppingListItem.objects
+        .filter(user=user)
+        .order_by('ingredient__name')
+        .values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        )
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def aggregate_shopping_lists():
+    """Суммы ингредиентов по корзинам всех пользователей из рецептов."""
+    return (
+        RecipeIngredients.objects
+        .filter(recipe__in_shopping_cart_of__isnull=False)
+        .values_list('recipe__in_shopping_cart_of__user', 'ingredient')
+        .annotate(total_amount=Sum('amount'))
+        .order_by()
+    )
+
+
+def get_recipe_amounts(recipe):
+    """Количество каждого ингредиента в рецепте."""
+    return dict(
+        RecipeIngredients.objects
+        .filter(recipe=recipe)
+        .values_list('ingredient_id', 'amount')
+    )
+
+
+def lock_recipe(recipe):
+    """Блокирует строку рецепта до конца транзакции.
+
+    Берется до чтения корзин и ингредиентов рецепта: правка
+    или удаление рецепта и добавление его в корзину выполняются
+    по очереди, и ни один список покупок не пропускает изменение.
+    """
+    list(
+        Recipe.objects.select_for_update().filter(pk=recipe).values_list('pk')
+    )
+
+
+def update_shopping_lists(users, deltas):
+    """Изменяет списки покупок пользователей на deltas.
+
+    deltas - словарь {id ингредиента: изменение количества}.
+    Вызывается внутри транзакции; строки пользователей блокируются,
+    чтобы параллельные изменения одной корзины не теряли обновления.
+    """
+    deltas = {
+        ingredient: delta for ingredient, delta in deltas.items() if delta
+    }
+    if not deltas:
+        return
+    users = list(users)
+    if not users:
+        return
+    list(
+        User.objects.select_for_update()
+        .filter(pk__in=users).order_by('pk').values_list('pk')
+    )
+    items = ShoppingListItem.objects.filter(
+        user__in=users, ingredient__in=deltas
+    )
+    items.update(amount=F('amount') + Case(
+        *(When(ingredient=ingredient, then=Value(delta))
+          for ingredient, delta in deltas.items()),
+        output_field=models.IntegerField()
+    ))
+    existing = set(items.values_list('user_id', 'ingredient_id'))
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user, ingredient_id=ingredient, amount=delta)
+        for user in users
+        for ingredient, delta in deltas.items()
+        if delta > 0 and (user, ingredient) not in existing
+    )
+    items.filter(amount__lte=0).delete()
+
+
+def update_recipe_carts(recipe, deltas):
+    """Изменяет на deltas списки покупок всех, у кого рецепт в корзине."""
+    update_shopping_lists(
+        ShoppingCart.objects.filter(recipe=recipe)
+        .values_list('user_id', flat=True),
+        deltas
+    )
+
+
+def deleted_directly(sender, origin):
+    """Строка удалена сама, а не каскадом от рецепта, пользователя
+    или ингредиента.
+
+    При каскаде списки покупок уже учтены: удаление рецепта вычитает его
+    из всех корзин, а строки списков удаленного пользователя или
+    ингредиента удаляются вместе с ними.
+    """
+    if isinstance(origin, models.QuerySet):
+        return origin.model is sender
+    return isinstance(origin, sender)
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу отдает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_txt(ingredients):
+    yield 'Список покупок:\n\n'
+    for name, unit, amount in ingredients:
+        yield f'- {name} - {amount} {unit}\n'
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for name, unit, amount in ingredients:
+        yield writer.writerow((name, amount, unit))
+
+
+def render_json(ingredients):
+    separator = ''
+    yield '['
+    for name, unit, amount in ingredients:
+        yield separator + json.dumps(
+            {'name': name, 'amount': amount, 'measurement_unit': unit},
+            ensure_ascii=False
+        )
+        separator = ','
+    yield ']'
+
+
+def get_pdf_font():
+    """Шрифт с кириллицей из настроек, либо встроенный Helvetica."""
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    font_path = settings.SHOPPING_CART_PDF_FONT
+    if not os.path.exists(font_path):
+        return PDF_FALLBACK_FONT
+    pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, font_path))
+    return PDF_FONT_NAME
+
+
+def render_pdf(ingredients):
+    # Размер документа ограничен числом разных ингредиентов,
+    # а не числом рецептов в корзине, поэтому PDF собирается в памяти
+    # и отдается частями.
+    buffer = io.BytesIO()
+    font = get_pdf_font()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    _, height = A4
+    y = height - PDF_MARGIN
+    pdf.setFont(font, PDF_FONT_SIZE)
+    for line in render_txt(ingredients):
+        for text in line.splitlines():
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(font, PDF_FONT_SIZE)
+                y = height - PDF_MARGIN
+            pdf.drawString(PDF_MARGIN, y, text)
+            y -= PDF_LINE_HEIGHT
+    pdf.save()
+    buffer.seek(0)
+    while chunk := buffer.read(PDF_BUFFER_SIZE):
+        yield chunk
+
+
+class ShoppingCartRenderer(renderers.BaseRenderer):
+    """Рендерер для выбора формата файла через ?format= или Accept.
+
+    Сам файл формирует вьюха, здесь рендерятся только ответы с ошибками.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class TxtRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CsvRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PdfRenderer(ShoppingCartRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+SHOPPING_CART_RENDERERS = (
+    TxtRenderer, CsvRenderer, renderers.JSONRenderer, PdfRenderer
+)
+
+SHOPPING_CART_WRITERS = {
+    'txt': render_txt,
+    'csv': render_csv,
+    'json': render_json,
+    'pdf': render_pdf,
+}
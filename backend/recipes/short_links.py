@@ -0,0 +1,77 @@
+import string
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Recipe
+
+
+ALPHABET = string.digits + string.ascii_letters
+BASE = len(ALPHABET)
+CODE_LENGTH = 6
+CODE_SPACE = BASE ** CODE_LENGTH
+LEGACY_CACHE_SIZE = 4096
+
+
+def encode_short_link(recipe_id):
+    """Код короткой ссылки по id рецепта.
+
+    id переводится аффинным преобразованием по модулю 62^6, поэтому
+    коды соседних рецептов не похожи друг на друга, а каждому id
+    соответствует ровно один код - без записи в БД и повторов.
+    """
+    number = (
+        recipe_id * settings.SHORT_LINK_MULTIPLIER + settings.SHORT_LINK_SALT
+    ) % CODE_SPACE
+    code = []
+    for _ in range(CODE_LENGTH):
+        number, digit = divmod(number, BASE)
+        code.append(ALPHABET[digit])
+    return ''.join(reversed(code))
+
+
+def decode_short_link(code):
+    """id рецепта по коду короткой ссылки или None для чужого кода."""
+    if len(code) != CODE_LENGTH:
+        return None
+    number = 0
+    for char in code:
+        digit = ALPHABET.find(char)
+        if digit < 0:
+            return None
+        number = number * BASE + digit
+    return (
+        (number - settings.SHORT_LINK_SALT)
+        * pow(settings.SHORT_LINK_MULTIPLIER, -1, CODE_SPACE)
+    ) % CODE_SPACE
+
+
+@lru_cache(maxsize=LEGACY_CACHE_SIZE)
+def resolve_legacy_short_link(code):
+    """id рецепта по короткой ссылке, сохраненной в БД до перехода на коды.
+
+    Кэш процесса сбрасывается при удалении рецепта (recipe_deleted).
+    """
+    return Recipe.objects.filter(short_link=code).values_list(
+        'pk', flat=True
+    ).first()
+
+
+def resolve_short_link(code):
+    """id рецепта по коду короткой ссылки.
+
+    Код из шести символов переводится в id без запроса к БД: если
+    такого рецепта нет, страницу 404 покажет фронтенд.
+    """
+    recipe_id = decode_short_link(code)
+    if recipe_id is None:
+        recipe_id = resolve_legacy_short_link(code)
+    return recipe_id
+
+
+async def aresolve_short_link(code):
+    recipe_id = decode_short_link(code)
+    if recipe_id is None:
+        recipe_id = await sync_to_async(resolve_legacy_short_link)(code)
+    return recipe_id
@@ -0,0 +1,246 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save, pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from foodgram.constants import RECIPE_IMAGE_RENDITIONS
+from foodgram.counters import change_counter, counter_delta
+from foodgram.renditions import file_saved, remember_file
+from recipes.fragments import invalidate_recipe_fragments
+from recipes.ingredient_index import invalidate_index
+from recipes.models import (Favorited, Ingredient, Recipe, RecipeIngredients,
+                            ShoppingCart, Tag)
+from recipes.shopping_cart import (deleted_directly, get_recipe_amounts,
+                                   lock_recipe, update_recipe_carts,
+                                   update_shopping_lists)
+from recipes.short_links import resolve_legacy_short_link
+from recipes.tag_masks import (clear_tag_bit, invalidate_tags,
+                               update_tags_masks)
+
+
+User = get_user_model()
+# Поля пользователя во фрагменте рецепта (RecipeAuthorSerializer).
+AUTHOR_FRAGMENT_FIELDS = (
+    'email', 'username', 'first_name', 'last_name', 'avatar'
+)
+
+
+def touch_recipes(recipes):
+    """Новая версия рецептов и сброс их фрагментов в кэше."""
+    recipe_ids = list(recipes.values_list('pk', flat=True))
+    Recipe.objects.filter(pk__in=recipe_ids).update(updated_at=timezone.now())
+    invalidate_recipe_fragments(recipe_ids)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    """Перестроение индекса ингредиентов после изменения справочника."""
+    transaction.on_commit(invalidate_index)
+
+
+@receiver([post_save, pre_delete], sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    """Новая версия рецептов, в которых изменился или удален тег."""
+    if not kwargs.get('created'):
+        touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_saved(sender, **kwargs):
+    transaction.on_commit(invalidate_tags)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    """Бит удаленного тега снимается с рецептов: его получит новый тег."""
+    if instance.bit is not None:
+        clear_tag_bit(Recipe.objects.filter(tags=instance), instance.bit)
+
+
+@receiver([post_save, pre_delete], sender=Ingredient)
+def ingredient_renamed(sender, instance, **kwargs):
+    """Новая версия рецептов, в которых изменился или удален ингредиент."""
+    if not kwargs.get('created'):
+        touch_recipes(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipe_fragments([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """Старая короткая ссылка удаленного рецепта больше не ведет на него."""
+    if instance.short_link:
+        transaction.on_commit(resolve_legacy_short_link.cache_clear)
+
+
+@receiver(post_init, sender=Recipe)
+def recipe_loaded(sender, instance, **kwargs):
+    remember_file(instance, 'image')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, created, update_fields, **kwargs):
+    """Уменьшенные копии нового фото рецепта создаются в фоне."""
+    file_saved(
+        instance, 'image', RECIPE_IMAGE_RENDITIONS, created, update_fields,
+        on_done=lambda: invalidate_recipe_fragments([instance.pk])
+    )
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredients)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    invalidate_recipe_fragments([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_recipe_fragments([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_recipe_fragments(
+            instance.recipes.values_list('pk', flat=True)
+        )
+    else:
+        invalidate_recipe_fragments(pk_set)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_mask_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    """Маска тегов рецепта следует за изменениями Recipe.tags."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            update_tags_masks([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        update_tags_masks(pk_set)
+    elif action == 'pre_clear' and instance.bit is not None:
+        clear_tag_bit(instance.recipes.all(), instance.bit)
+
+
+def author_fragment_values(user):
+    """Значения полей автора, которые входят во фрагмент рецепта."""
+    return tuple(
+        getattr(value, 'name', value) or ''
+        for value in map(user.__dict__.get, AUTHOR_FRAGMENT_FIELDS)
+    )
+
+
+@receiver(post_init, sender=User)
+def author_loaded(sender, instance, **kwargs):
+    instance._fragment_values = author_fragment_values(instance)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    """Сброс фрагментов рецептов автора после изменения профиля.
+
+    Сохранения, не меняющие полей из фрагмента, например last_login
+    при каждом входе, фрагменты не сбрасывают.
+    """
+    if created or (
+        update_fields is not None
+        and not update_fields & set(AUTHOR_FRAGMENT_FIELDS)
+    ):
+        return
+    values = author_fragment_values(instance)
+    if values != instance._fragment_values:
+        instance._fragment_values = values
+        invalidate_recipe_fragments(
+            instance.recipes.values_list('pk', flat=True)
+        )
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipes_counted(sender, instance, signal, created=False, **kwargs):
+    delta = counter_delta(signal, created)
+    if delta:
+        change_counter(User, instance.author_id, 'recipes_count', delta)
+
+
+@receiver([post_save, post_delete], sender=Favorited)
+def favorites_counted(sender, instance, signal, created=False, **kwargs):
+    delta = counter_delta(signal, created)
+    if delta:
+        change_counter(
+            Recipe, instance.recipe_id, 'favorites_count', delta,
+            similar_stale=True
+        )
+
+
+@receiver([post_save, post_delete], sender=ShoppingCart)
+def carts_counted(sender, instance, signal, created=False, **kwargs):
+    delta = counter_delta(signal, created)
+    if delta:
+        change_counter(
+            Recipe, instance.recipe_id, 'in_carts_count', delta,
+            similar_stale=True
+        )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_added(sender, instance, created, **kwargs):
+    """Рецепт из корзины добавляется в список покупок пользователя."""
+    if created:
+        update_shopping_lists(
+            [instance.user_id], get_recipe_amounts(instance.recipe_id)
+        )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def cart_removed(sender, instance, origin=None, **kwargs):
+    if deleted_directly(sender, origin):
+        update_shopping_lists([instance.user_id], {
+            ingredient: -amount for ingredient, amount
+            in get_recipe_amounts(instance.recipe_id).items()
+        })
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_removed_from_carts(sender, instance, **kwargs):
+    """Удаленный рецепт вычитается из списков покупок всех корзин.
+
+    Срабатывает до каскадного удаления корзин и ингредиентов рецепта,
+    при любом способе удаления: через API, админку или вместе с автором.
+    """
+    lock_recipe(instance.pk)
+    update_recipe_carts(instance.pk, {
+        ingredient: -amount for ingredient, amount
+        in get_recipe_amounts(instance.pk).items()
+    })
+
+
+@receiver(post_init, sender=RecipeIngredients)
+def recipe_ingredient_loaded(sender, instance, **kwargs):
+    instance._saved_row = (
+        instance.__dict__.get('ingredient_id'), instance.__dict__.get('amount')
+    )
+
+
+@receiver(post_save, sender=RecipeIngredients)
+def recipe_ingredient_saved(sender, instance, created, **kwargs):
+    """Изменение строки ингредиента в корзинах с этим рецептом.
+
+    bulk_create и bulk_update сигналов не отправляют, их изменения
+    RecipeCreateSerializer передает в списки покупок сам.
+    """
+    deltas = {instance.ingredient_id: instance.amount}
+    if not created:
+        ingredient, amount = instance._saved_row
+        deltas[ingredient] = deltas.get(ingredient, 0) - amount
+    instance._saved_row = (instance.ingredient_id, instance.amount)
+    update_recipe_carts(instance.recipe_id, deltas)
+
+
+@receiver(post_delete, sender=RecipeIngredients)
+def recipe_ingredient_removed(sender, instance, origin=None, **kwargs):
+    if deleted_directly(sender, origin):
+        update_recipe_carts(
+            instance.recipe_id, {instance.ingredient_id: -instance.amount}
+        )
@@ -0,0 +1,175 @@
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from .models import (Favorited, Recipe, RecipeIngredients, ShoppingCart,
+                     SimilarRecipe)
+
+
+BATCH_SIZE = 1000
+# Сколько строк читается из курсора БД за раз.
+FETCH_SIZE = 10000
+# Вес рецепта в корзине пользователя относительно избранного.
+CART_WEIGHT = 0.5
+
+
+def id_array(queryset, width=1):
+    """Числа из values_list в массиве int64 с width столбцами.
+
+    Строки читаются из курсора частями и сразу складываются в массив,
+    без промежуточного списка кортежей Python.
+    """
+    rows = queryset.iterator(chunk_size=FETCH_SIZE)
+    if width > 1:
+        rows = chain.from_iterable(rows)
+    return np.fromiter(rows, dtype=np.int64).reshape(-1, width)
+
+
+def pairs(queryset):
+    """Пары (id рецепта, id столбца) из values_list в виде двух массивов."""
+    array = id_array(queryset, width=2)
+    return array[:, 0], array[:, 1]
+
+
+def recipe_matrix(ids, parts):
+    """Разреженная матрица рецепт x столбец по частям (рецепты, столбцы, вес).
+
+    Номер строки - позиция рецепта в отсортированном ids, номер
+    столбца - id пользователя или ингредиента. Повторы суммируются.
+    """
+    rows, columns, weights = [], [], []
+    for recipes, part_columns, weight in parts:
+        rows.append(np.searchsorted(ids, recipes))
+        columns.append(part_columns)
+        weights.append(np.full(len(recipes), weight, dtype=np.float32))
+    rows, columns = np.concatenate(rows), np.concatenate(columns)
+    width = int(columns.max()) + 1 if len(columns) else 0
+    return sparse.csr_matrix(
+        (np.concatenate(weights), (rows, columns)), shape=(len(ids), width)
+    )
+
+
+def normalize_rows(matrix):
+    """Строки единичной длины; нулевые строки остаются нулевыми."""
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1))).ravel()
+    scale = np.divide(
+        1.0, norms, out=np.zeros_like(norms), where=norms > 0
+    ).astype(np.float32)
+    return sparse.diags(scale) @ matrix
+
+
+def similarity_matrix(ids, ingredient_weight):
+    """Векторы рецептов, скалярное произведение которых - оценка сходства.
+
+    Оценка - взвешенная сумма косинусов по пользователям (избранное
+    и корзины) и по ингредиентам с весом IDF, чтобы соль и вода
+    не делали похожими все рецепты.
+    """
+    users = recipe_matrix(ids, [
+        (*pairs(Favorited.objects.values_list('recipe_id', 'user_id')), 1.0),
+        (
+            *pairs(ShoppingCart.objects.values_list('recipe_id', 'user_id')),
+            CART_WEIGHT
+        ),
+    ])
+    ingredients = recipe_matrix(ids, [(*pairs(
+        RecipeIngredients.objects.values_list('recipe_id', 'ingredient_id')
+    ), 1.0)])
+    ingredients.data[:] = 1.0
+    recipes_with = np.bincount(
+        ingredients.indices, minlength=ingredients.shape[1]
+    )
+    idf = np.log((1 + len(ids)) / (1 + recipes_with)) + 1
+    ingredients = ingredients @ sparse.diags(idf.astype(np.float32))
+    return sparse.hstack([
+        normalize_rows(users) * np.float32(np.sqrt(1 - ingredient_weight)),
+        normalize_rows(ingredients) * np.float32(np.sqrt(ingredient_weight)),
+    ]).tocsr()
+
+
+def top_similar(matrix, rows, top_k, block_size):
+    """Для строк rows - top_k самых похожих строк matrix и их оценки.
+
+    Оценки считаются блоками по block_size строк, поэтому в памяти
+    одновременно не больше block_size x число рецептов оценок.
+    Выдает тройки (строки блока, индексы похожих, оценки).
+    """
+    transposed = matrix.T.tocsr()
+    top_k = min(top_k, matrix.shape[0] - 1)
+    if top_k <= 0:
+        return
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        scores = (matrix[block] @ transposed).toarray()
+        scores[np.arange(len(block)), block] = 0
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        yield (
+            block,
+            np.take_along_axis(top, order, axis=1),
+            np.take_along_axis(top_scores, order, axis=1),
+        )
+
+
+def mark_stale(recipe_ids, stale):
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        Recipe.objects.filter(
+            pk__in=recipe_ids[start:start + BATCH_SIZE].tolist()
+        ).update(similar_stale=stale)
+
+
+def build_similar_recipes(top_k, block_size, ingredient_weight,
+                          incremental=False):
+    """Пересчитывает похожие рецепты и возвращает число пересчитанных.
+
+    С incremental=True пересчитываются только рецепты, у которых
+    изменились избранное или корзины (similar_stale). Флаг снимается
+    до чтения данных: изменения во время расчета снова выставят его,
+    и рецепт пересчитается в следующий раз.
+    """
+    recipes = Recipe.objects.order_by('pk')
+    if incremental:
+        recipes = recipes.filter(similar_stale=True)
+    targets = id_array(recipes.values_list('pk', flat=True)).ravel()
+    if not len(targets):
+        return 0
+    mark_stale(targets, False)
+    try:
+        ids = id_array(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        ).ravel()
+        matrix = similarity_matrix(ids, ingredient_weight)
+        rows = np.searchsorted(ids, targets)
+        with transaction.atomic():
+            if incremental:
+                for start in range(0, len(targets), BATCH_SIZE):
+                    SimilarRecipe.objects.filter(
+                        recipe__in=targets[start:start + BATCH_SIZE].tolist()
+                    ).delete()
+            else:
+                SimilarRecipe.objects.all().delete()
+            for block, top, scores in top_similar(
+                matrix, rows, top_k, block_size
+            ):
+                SimilarRecipe.objects.bulk_create(
+                    (
+                        SimilarRecipe(
+                            recipe_id=int(ids[row]),
+                            similar_id=int(ids[similar]),
+                            rank=rank, score=float(score)
+                        )
+                        for row, similar_row, score_row
+                        in zip(block, top, scores)
+                        for rank, (similar, score)
+                        in enumerate(zip(similar_row, score_row))
+                        if score > 0
+                    ),
+                    batch_size=BATCH_SIZE
+                )
+    except BaseException:
+        mark_stale(targets, True)
+        raise
+    return len(targets)
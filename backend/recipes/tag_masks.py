@@ -0,0 +1,95 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F, Q
+
+from recipes.models import Recipe, Tag
+
+
+_tags = None
+_loaded_at = 0
+_lock = threading.Lock()
+
+
+def get_tags(slugs=()):
+    """Словарь {slug: (id, бит)} всех тегов из памяти процесса.
+
+    Тегов мало и они почти не меняются, поэтому словарь обновляется
+    раз в TAG_CACHE_TTL секунд, а в своем процессе - сразу по сигналу
+    об изменении тега. Если какого-то из slugs нет в словаре, он
+    перечитывается сразу: тег мог появиться в другом процессе.
+    """
+    global _tags, _loaded_at
+    tags = _tags
+    if (
+        tags is None
+        or time.monotonic() - _loaded_at > settings.TAG_CACHE_TTL
+        or any(slug not in tags for slug in slugs)
+    ):
+        with _lock:
+            if _tags is tags:
+                _tags = {
+                    slug: (pk, bit) for pk, slug, bit
+                    in Tag.objects.values_list('pk', 'slug', 'bit')
+                }
+                _loaded_at = time.monotonic()
+            tags = _tags
+    return tags
+
+
+def invalidate_tags():
+    global _tags
+    with _lock:
+        _tags = None
+
+
+def filter_by_tags(queryset, slugs):
+    """Рецепты хотя бы с одним из тегов.
+
+    Проверяется одно условие на маску рецепта, без JOIN и DISTINCT.
+    Побитовое условие не использует индекс: страница читается по
+    индексу (created_at, id), а маска проверяется у каждой строки.
+    Теги, которым не хватило бита, ищутся через таблицу связей.
+    """
+    tags = get_tags(slugs)
+    mask = 0
+    unmasked = []
+    for slug in slugs:
+        pk, bit = tags.get(slug, (None, None))
+        if pk is None:
+            continue
+        if bit is None:
+            unmasked.append(pk)
+        else:
+            mask |= 1 << bit
+    condition = Q(tags_match__gt=0)
+    if unmasked:
+        condition |= Q(pk__in=Recipe.tags.through.objects.filter(
+            tag__in=unmasked
+        ).values('recipe'))
+    return queryset.alias(
+        tags_match=F('tags_mask').bitand(mask)
+    ).filter(condition)
+
+
+def update_tags_masks(recipe_ids):
+    """Пересчитывает маски тегов рецептов по таблице связей.
+
+    Биты берутся из БД, а не из памяти процесса, чтобы маска
+    не зависела от того, успел ли воркер узнать о новом теге.
+    """
+    masks = dict.fromkeys(recipe_ids, 0)
+    for recipe, bit in Recipe.tags.through.objects.filter(
+        recipe__in=masks, tag__bit__isnull=False
+    ).values_list('recipe_id', 'tag__bit'):
+        masks[recipe] |= 1 << bit
+    recipes_by_mask = {}
+    for recipe, mask in masks.items():
+        recipes_by_mask.setdefault(mask, []).append(recipe)
+    for mask, recipes in recipes_by_mask.items():
+        Recipe.objects.filter(pk__in=recipes).update(tags_mask=mask)
+
+
+def clear_tag_bit(recipes, bit):
+    recipes.update(tags_mask=F('tags_mask').bitand(~(1 << bit)))
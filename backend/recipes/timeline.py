@@ -0,0 +1,168 @@
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from users.models import Follow
+from .models import Recipe, TimelineEntry
+
+
+BATCH_SIZE = 1000
+
+
+def add_entries(users, recipes):
+    """Записывает рецепты (id, автор, дата) в ленты пользователей."""
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user, recipe_id=recipe, author_id=author,
+                created_at=created_at
+            )
+            for user in users
+            for recipe, author, created_at in recipes
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def get_fan_out_followers(author):
+    """Подписчики автора или None, если их больше порога рассылки."""
+    followers = list(
+        Follow.objects.filter(following=author)
+        .values_list('user_id', flat=True)
+        [:settings.FEED_FANOUT_MAX_FOLLOWERS + 1]
+    )
+    if len(followers) > settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return None
+    return followers
+
+
+def fan_out_recipes(recipes):
+    """Записывает новые рецепты в ленты подписчиков их авторов.
+
+    Рецепты авторов, у которых подписчиков больше
+    FEED_FANOUT_MAX_FOLLOWERS, остаются с fanned_out=False,
+    и лента читает их при запросе.
+    """
+    if not settings.FEED_TIMELINES:
+        return
+    by_author = defaultdict(list)
+    for recipe in recipes:
+        by_author[recipe.author_id].append(
+            (recipe.pk, recipe.author_id, recipe.created_at)
+        )
+    fanned_out = []
+    for author, rows in by_author.items():
+        followers = get_fan_out_followers(author)
+        if followers is not None:
+            add_entries(followers, rows)
+            fanned_out += [recipe for recipe, _, _ in rows]
+    Recipe.objects.filter(pk__in=fanned_out).update(fanned_out=True)
+
+
+def latest_recipes(author):
+    """Последние разосланные по лентам рецепты автора."""
+    return (
+        Recipe.objects.filter(author=author, fanned_out=True)
+        .order_by('-created_at', '-id')
+        .values_list('pk', 'author_id', 'created_at')
+        [:settings.FEED_BACKFILL_SIZE]
+    )
+
+
+def backfill_timeline(user, author):
+    """Добавляет в ленту нового подписчика последние рецепты автора."""
+    if settings.FEED_TIMELINES:
+        add_entries([user], latest_recipes(author))
+
+
+def trim_timeline(user, author):
+    """Удаляет рецепты автора из ленты отписавшегося пользователя."""
+    if settings.FEED_TIMELINES:
+        TimelineEntry.objects.filter(user=user, author=author).delete()
+
+
+def after(position, created_at, pk):
+    """Условие keyset-пагинации: строки после (created_at, id).
+
+    Отдельное условие created_at <= ... дает планировщику диапазон
+    по индексу; без него OR читается через индекс по всем рецептам.
+    """
+    if position is None:
+        return Q()
+    return Q(**{f'{created_at}__lte': position[0]}) & (
+        Q(**{f'{created_at}__lt': position[0]})
+        | Q(**{f'{pk}__lt': position[1]})
+    )
+
+
+def get_joined_feed(user, position, size):
+    """Страница ленты подписок одним JOIN подписок с рецептами."""
+    return list(
+        Recipe.objects.filter(
+            author__in=Follow.objects.filter(user=user).values('following')
+        )
+        .filter(after(position, 'created_at', 'id'))
+        .order_by('-created_at', '-id')
+        .values_list('created_at', 'id')[:size]
+    )
+
+
+def get_feed(user, position, size):
+    """Страница ленты подписок: до size пар (created_at, id) рецептов.
+
+    position - такая же пара последнего рецепта предыдущей страницы.
+    С FEED_TIMELINES рецепты из ленты пользователя и рецепты, которые
+    не рассылались по лентам, читаются двумя запросами по индексам
+    и сливаются по убыванию (created_at, id).
+    """
+    if not settings.FEED_TIMELINES:
+        return get_joined_feed(user, position, size)
+    entries = (
+        TimelineEntry.objects.filter(user=user)
+        .filter(after(position, 'created_at', 'recipe_id'))
+        .order_by('-created_at', '-recipe_id')
+        .values_list('created_at', 'recipe_id')[:size]
+    )
+    pulled = (
+        Recipe.objects.filter(
+            author__in=Follow.objects.filter(user=user).values('following'),
+            fanned_out=False
+        )
+        .filter(after(position, 'created_at', 'id'))
+        .order_by('-created_at', '-id')
+        .values_list('created_at', 'id')[:size]
+    )
+    merged = heapq.merge(entries, pulled, reverse=True)
+    return list(dict.fromkeys(merged))[:size]
+
+
+def rebuild_timelines():
+    """Пересобирает ленты подписок по текущим подпискам.
+
+    Рецепты авторов, у которых не больше FEED_FANOUT_MAX_FOLLOWERS
+    подписчиков, помечаются разосланными, и каждый подписчик получает
+    последние FEED_BACKFILL_SIZE из них, как при новой подписке.
+    Возвращает число записей в лентах.
+    """
+    TimelineEntry.objects.all().delete()
+    crowded = (
+        Follow.objects.values('following')
+        .annotate(followers_total=Count('pk'))
+        .filter(followers_total__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+        .values('following')
+    )
+    Recipe.objects.update(fanned_out=True)
+    Recipe.objects.filter(author__in=crowded).update(fanned_out=False)
+    followers = defaultdict(list)
+    for user, author in (
+        Follow.objects.exclude(following__in=crowded)
+        .values_list('user_id', 'following_id')
+        .iterator(chunk_size=BATCH_SIZE)
+    ):
+        followers[author].append(user)
+    for author, users in followers.items():
+        add_entries(users, list(latest_recipes(author)))
+    return TimelineEntry.objects.count()
@@ -1,26 +1,42 @@
-import uuid
+import json
+from collections import Counter
 
-from django.db import models
-from django.http import HttpResponse
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Value
+from django.http import Http404, QueryDict, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import mixins, permissions, status, viewsets
+from rest_framework import generics, mixins, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
+from api.async_views import AsyncReadMixin, aget_object_or_404
+from api.conditional import get_not_modified, make_etag, set_validators
+from api.pagination import FeedCursorPagination, RecipeCursorPagination
 from api.permissions import FoodgramPermission
+from foodgram.constants import RECIPE_BULK_CREATE_MAX_SIZE
 from foodgram.filters import NameFilter, RecipeFilter
-from .models import (Ingredient, Recipe, RecipeIngredients,
+from foodgram.timing import TimingMixin, timed
+from users.models import Follow
+from .ingredient_index import aget_index, get_index
+from .models import (Ingredient, Recipe,
                      Tag, Favorited, ShoppingCart)
+from .shopping_cart import (SHOPPING_CART_RENDERERS, SHOPPING_CART_WRITERS,
+                            get_cart_ingredients)
+from .short_links import (aresolve_short_link, encode_short_link,
+                          resolve_short_link)
+from .timeline import get_feed
 from .serializers import (IngredientSerializer, RecipeCreateSerializer,
                           RecipeFavoriteShoppingCartSerializer,
                           RecipeSerializer, TagSerializer,
                           FavoritedSerializer, ShoppingCartSerializer)
 
 
-class TagViewSet(viewsets.GenericViewSet, mixins.ListModelMixin,
-                 mixins.RetrieveModelMixin):
+class TagViewSet(TimingMixin, AsyncReadMixin, viewsets.GenericViewSet,
+                 mixins.ListModelMixin, mixins.RetrieveModelMixin):
     """Вьюсет для тэгов."""
     permission_classes = [permissions.AllowAny, ]
     queryset = Tag.objects.all()
@@ -28,7 +44,8 @@ class TagViewSet(viewsets.GenericViewSet, mixins.ListModelMixin,
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.GenericViewSet, mixins.ListModelMixin,
+class IngredientViewSet(TimingMixin, AsyncReadMixin,
+                        viewsets.GenericViewSet, mixins.ListModelMixin,
                         mixins.RetrieveModelMixin):
     """Вьюсет для ингредиентов."""
     permission_classes = [permissions.AllowAny, ]
@@ -38,8 +55,17 @@ class IngredientViewSet(viewsets.GenericViewSet, mixins.ListModelMixin,
     filter_backends = [NameFilter, ]
     search_fields = ['name', ]
 
+    def list(self, request, *args, **kwargs):
+        """Список ингредиентов из индекса в памяти, без запроса к БД."""
+        index = get_index()
+        return Response(index.search(request.query_params.get('name', '')))
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    async def alist(self, request, *args, **kwargs):
+        index = await aget_index()
+        return Response(index.search(request.query_params.get('name', '')))
+
+
+class RecipeViewSet(TimingMixin, AsyncReadMixin, viewsets.ModelViewSet):
     """Вьюсет для рецептов."""
     permission_classes = [FoodgramPermission]
     queryset = Recipe.objects.all()
@@ -47,24 +73,209 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filterset_class = RecipeFilter
     pagination_class = PageNumberPagination
 
+    @property
+    def paginator(self):
+        """Пагинация по курсору, если в запросе передан параметр cursor."""
+        if not hasattr(self, '_paginator'):
+            cursor_pagination = RecipeCursorPagination()
+            if cursor_pagination.cursor_query_param in (
+                self.request.query_params
+            ):
+                cursor_pagination.ordering = self.get_cursor_ordering()
+                self._paginator = cursor_pagination
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_cursor_ordering(self):
+        """Порядок курсора по параметру ordering.
+
+        Курсор указывает место в ленте по неизменяемым полям, поэтому
+        допускается только порядок по дате. Счетчики меняются между
+        запросами, а релевантность поиска не хранится в строке: с ними
+        курсор пропускал бы и повторял рецепты.
+        """
+        params = self.request.query_params
+        if params.get('search', '').strip():
+            raise ParseError(
+                'Поиск не поддерживает постраничный вывод по курсору.'
+            )
+        ordering = params.get('ordering') or '-created_at'
+        if ordering not in ('created_at', '-created_at'):
+            raise ParseError(
+                'С курсором доступна только сортировка по created_at.'
+            )
+        return (ordering, ordering.replace('created_at', 'id'))
+
+    def get_viewer_flags(self):
+        """Подзапросы флагов избранного и корзины текущего пользователя."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return {
+                'is_favorited': Value(False),
+                'is_in_shopping_cart': Value(False),
+            }
+        return {
+            'is_favorited': Exists(Favorited.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            'is_in_shopping_cart': Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        }
+
+    def get_subscription_flag(self, author):
+        """Подзапрос подписки текущего пользователя на автора."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return Value(False)
+        return Exists(Follow.objects.filter(user=user, following=author))
+
+    def get_queryset(self):
+        """Рецепты с флагами текущего пользователя.
+
+        Флаги избранного, корзины и подписки на автора вычисляются
+        подзапросами EXISTS. Теги, автор и ингредиенты берутся из кэша
+        фрагментов, а недостающие фрагменты загружаются пачкой, поэтому
+        число запросов не зависит от размера страницы.
+        """
+        return Recipe.objects.annotate(
+            **self.get_viewer_flags(),
+            author_is_subscribed=self.get_subscription_flag(
+                OuterRef('author')
+            )
+        )
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.fragment_stats = Counter()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fragment_stats'] = getattr(self, 'fragment_stats', None)
+        return context
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Счетчики попаданий в кэш фрагментов в заголовке ответа."""
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        stats = getattr(self, 'fragment_stats', None)
+        if stats:
+            response['X-Recipe-Cache'] = (
+                f'hits={stats["hits"]}, misses={stats["misses"]}'
+            )
+        return response
+
+    def get_version_queryset(self):
+        """Версии рецепта и автора и флаги пользователя без самого рецепта."""
+        return Recipe.objects.annotate(
+            **self.get_viewer_flags(),
+            is_subscribed=self.get_subscription_flag(OuterRef('author'))
+        ).values_list(
+            'updated_at', 'author__updated_at', 'is_favorited',
+            'is_in_shopping_cart', 'is_subscribed'
+        )
+
+    @staticmethod
+    def get_validators(pk, versions):
+        """ETag и дата изменения рецепта по его версиям."""
+        recipe_updated_at, author_updated_at, *flags = versions
+        etag = make_etag(pk, recipe_updated_at, author_updated_at, *flags)
+        return etag, max(recipe_updated_at, author_updated_at)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Рецепт с поддержкой условных запросов.
+
+        Версия рецепта, автора и флаги пользователя читаются одним
+        легким запросом, и при совпадении ETag ответ 304 отдается
+        без загрузки и сериализации рецепта.
+        """
+        etag, last_modified = self.get_validators(
+            kwargs['pk'], generics.get_object_or_404(
+                self.get_version_queryset(), pk=kwargs['pk']
+            )
+        )
+        not_modified = get_not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = super().retrieve(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+
+    async def alist(self, request, *args, **kwargs):
+        """Список рецептов в режиме ASGI.
+
+        Фильтры применяются в потоке: проверка их значений обращается
+        к БД через синхронный ORM.
+        """
+        self.fragment_stats = Counter()
+        queryset = await sync_to_async(self.filter_queryset)(
+            self.get_queryset()
+        )
+        recipes = await self.apaginate_queryset(queryset)
+        serializer = self.get_serializer(many=True)
+        with timed('serialize'):
+            data = await serializer.ato_representation(recipes)
+        return self.get_paginated_response(data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        """Рецепт с поддержкой условных запросов в режиме ASGI."""
+        self.fragment_stats = Counter()
+        etag, last_modified = self.get_validators(
+            kwargs['pk'], await aget_object_or_404(
+                self.get_version_queryset(), pk=kwargs['pk']
+            )
+        )
+        not_modified = get_not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        recipe = await aget_object_or_404(
+            self.get_queryset(), pk=kwargs['pk']
+        )
+        with timed('serialize'):
+            data = await self.get_serializer().ato_representation(recipe)
+        return set_validators(Response(data), etag, last_modified)
+
     def get_serializer_class(self):
         if self.action in ['create', 'patch', 'partial_update']:
             return RecipeCreateSerializer
         return RecipeSerializer
 
+    @staticmethod
+    def get_recipe_data(request):
+        """Данные рецепта из JSON или из multipart-запроса.
+
+        В multipart поля рецепта передаются JSON-строкой в части data,
+        а изображение - файлом в части image.
+        """
+        if not isinstance(request.data, QueryDict):
+            return request.data
+        try:
+            data = json.loads(request.data.get('data') or '{}')
+        except ValueError:
+            raise ParseError('Поле data должно содержать JSON.')
+        if not isinstance(data, dict):
+            raise ParseError('Поле data должно содержать JSON-объект.')
+        if 'image' in request.FILES:
+            data['image'] = request.FILES['image']
+        return data
+
     def create_or_update(self, request, instance=None):
         """Создание или обновление рецепта."""
+        data = self.get_recipe_data(request)
         serializer = RecipeCreateSerializer(
-            data=request.data,
+            data=data,
             context=self.get_serializer_context(),
             instance=instance,
             partial=(instance is not None)
         )
         serializer.is_valid(raise_exception=True)
-        if not request.data.get('image') and not instance:
+        if not data.get('image') and not instance:
             return Response(status=status.HTTP_400_BAD_REQUEST)
         if instance:
             recipe = serializer.save()
+            # Сбрасываем предзагруженные теги и ингредиенты.
+            recipe._prefetched_objects_cache = {}
         else:
             recipe = serializer.save(author=self.request.user)
         output_serializer = RecipeSerializer(
@@ -82,23 +293,80 @@ class RecipeViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         return self.create_or_update(request, instance)
 
+    @action(detail=False, methods=['POST'], url_path='bulk',
+            permission_classes=[permissions.IsAuthenticated])
+    def bulk_create(self, request):
+        """Создание списка рецептов одним запросом."""
+        serializer = RecipeCreateSerializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=RECIPE_BULK_CREATE_MAX_SIZE,
+            context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.save(author=request.user)
+        output_serializer = RecipeSerializer(
+            self.get_queryset().filter(
+                pk__in=[recipe.pk for recipe in recipes]
+            ),
+            many=True,
+            context=self.get_serializer_context()
+        )
+        return Response(output_serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['GET'], url_path='feed',
+            permission_classes=[permissions.IsAuthenticated])
+    def feed(self, request):
+        """Новые рецепты авторов из подписок, по курсору."""
+        paginator = FeedCursorPagination()
+        ids = paginator.paginate_feed(
+            lambda position, size: get_feed(request.user, position, size),
+            request
+        )
+        recipes = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['GET'],
+            url_path=r'(?P<recipe_id>\d+)/similar')
+    def similar(self, request, recipe_id):
+        """Похожие рецепты из предрассчитанной таблицы одним запросом."""
+        recipes = (
+            Recipe.objects.filter(similar_to__recipe=recipe_id)
+            .order_by('similar_to__rank')
+            .only('id', 'name', 'image', 'rendered_image', 'cooking_time')
+        )
+        serializer = RecipeFavoriteShoppingCartSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        if not serializer.data and not Recipe.objects.filter(
+            pk=recipe_id
+        ).exists():
+            raise Http404
+        return Response(serializer.data)
+
     @action(detail=False, methods=['GET'],
             url_path=r'(?P<recipe_id>\d+)/get-link')
     def get_short_link(self, request, recipe_id):
-        """Получение (создание) короткой ссылки на рецепт."""
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
-        if not recipe.short_link:
-            link = uuid.uuid4().hex[:3]
-            recipe.short_link = link
-            recipe.save()
-        url = f"{request.get_host()}/s/{recipe.short_link}"
+        """Получение короткой ссылки на рецепт."""
+        if not Recipe.objects.filter(pk=recipe_id).exists():
+            raise Http404
+        url = f"{request.get_host()}/s/{encode_short_link(int(recipe_id))}"
         return Response({'short-link': url}, status=status.HTTP_200_OK)
 
     @staticmethod
-    def create_object(request, pk, serializer_class):
-        """Метод для создания объектов."""
+    def create_object(request, pk, serializer_class, lock=False):
+        """Метод для создания объектов.
+
+        С lock=True строка рецепта блокируется до конца транзакции.
+        """
         user = request.user.id
-        recipe = get_object_or_404(Recipe, pk=pk)
+        recipe = get_object_or_404(
+            Recipe.objects.select_for_update() if lock else Recipe, pk=pk
+        )
         if not recipe:
             return Response(status=status.HTTP_404_NOT_FOUND)
         serializer = serializer_class(
@@ -113,10 +381,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
-    def delete_object(request, pk, model):
-        """Метод для удаления объектов."""
+    def delete_object(request, pk, model, lock=False):
+        """Метод для удаления объектов.
+
+        С lock=True строка рецепта блокируется до конца транзакции.
+        """
         user = request.user.id
-        recipe = get_object_or_404(Recipe, pk=pk)
+        recipe = get_object_or_404(
+            Recipe.objects.select_for_update() if lock else Recipe, pk=pk
+        )
         if not recipe:
             return Response(status=status.HTTP_404_NOT_FOUND)
         obj = model.objects.filter(user=user, recipe=recipe)
@@ -150,50 +423,59 @@ class RecipeViewSet(viewsets.ModelViewSet):
             url_path=r'(?P<recipe_id>\d+)/shopping_cart')
     def shopping_cart(self, request, recipe_id):
         """Добавление рецепта в корзину."""
-        return self.create_object(
-            request=request,
-            pk=recipe_id,
-            serializer_class=ShoppingCartSerializer
-        )
+        # Рецепт блокируется, чтобы его одновременная правка учла
+        # новую корзину или эта корзина - новые ингредиенты.
+        with transaction.atomic():
+            return self.create_object(
+                request=request,
+                pk=recipe_id,
+                serializer_class=ShoppingCartSerializer,
+                lock=True
+            )
 
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, recipe_id):
         """Удаление рецепта из корзины."""
-        return self.delete_object(
-            request=request,
-            pk=recipe_id,
-            model=ShoppingCart
-        )
+        with transaction.atomic():
+            return self.delete_object(
+                request=request,
+                pk=recipe_id,
+                model=ShoppingCart,
+                lock=True
+            )
 
-    @action(detail=False, methods=['GET'], url_path='download_shopping_cart')
+    @action(detail=False, methods=['GET'], url_path='download_shopping_cart',
+            permission_classes=[permissions.IsAuthenticated],
+            renderer_classes=SHOPPING_CART_RENDERERS)
     def download_shopping_cart(self, request):
-        """Скачивание корзины."""
-        user = request.user
-        recipes = [
-            item.recipe for item in ShoppingCart.objects.filter(
-                user=user
-            ).select_related('recipe')
-        ]
-        cart = ['Список покупок:\n\n']
-        ingredients = (
-            RecipeIngredients.objects
-            .filter(recipe__in=recipes)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=models.Sum('amount'))
-            .order_by('ingredient__name')
-        )
-        for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            unit = ingredient['ingredient__measurement_unit']
-            amount = ingredient['total_amount']
-            cart.append(f'- {name} - {amount} {unit}\n')
-        file_content = ''.join(cart)
-        response = HttpResponse(file_content, content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; filename="cart.txt"'
+        """Скачивание корзины в формате txt, csv, json или pdf."""
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            SHOPPING_CART_WRITERS[renderer.format](
+                get_cart_ingredients(request.user)
+            ),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="cart.{renderer.format}"'
+        )
         return response
 
 
 def redirect_from_short_link(request, short_link):
     """Переадресация с короткой ссылки на страницу рецепта."""
-    recipe = get_object_or_404(Recipe, short_link=short_link)
-    return redirect(f'/recipes/{recipe.id}/')
+    recipe_id = resolve_short_link(short_link)
+    if recipe_id is None:
+        raise Http404
+    return redirect(f'/recipes/{recipe_id}/')
+
+
+async def aredirect_from_short_link(request, short_link):
+    """redirect_from_short_link для режима ASGI."""
+    recipe_id = await aresolve_short_link(short_link)
+    if recipe_id is None:
+        raise Http404
+    return redirect(f'/recipes/{recipe_id}/')
@@ -1,11 +1,13 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
-from foodgram.constants import EMAIL_MAX_LENGTH, USER_MAX_LENGTH
+from foodgram.constants import (EMAIL_MAX_LENGTH, IMAGE_NAME_MAX_LENGTH,
+                                USER_MAX_LENGTH)
+from foodgram.counters import DenormalizedFieldsMixin
 from foodgram.validators import ValidationMixin
 
 
-class User(AbstractUser, ValidationMixin):
+class User(DenormalizedFieldsMixin, AbstractUser, ValidationMixin):
     username = models.CharField(
         max_length=USER_MAX_LENGTH,
         unique=True,
@@ -21,8 +23,18 @@ class User(AbstractUser, ValidationMixin):
         null=True,
         blank=True
     )
+    rendered_avatar = models.CharField(
+        max_length=IMAGE_NAME_MAX_LENGTH, blank=True, default='',
+        editable=False
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    recipes_count = models.PositiveIntegerField(default=0, editable=False)
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username',)
+    denormalized_fields = (
+        'recipes_count', 'followers_count', 'rendered_avatar'
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -3,19 +3,24 @@ import re
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
-from foodgram.constants import EMAIL_MAX_LENGTH, PATTERN, USER_MAX_LENGTH
+from foodgram.constants import (AVATAR_RENDITIONS, EMAIL_MAX_LENGTH, PATTERN,
+                                RECIPE_IMAGE_RENDITIONS, USER_MAX_LENGTH)
+from foodgram.renditions import RenditionsField
+from foodgram.uploads import UploadImageField
 from .models import Follow, User
 from recipes.models import Recipe
 
 
 class AbstractUserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
-    avatar = Base64ImageField(required=False, allow_null=True)
+    avatar = UploadImageField(required=False, allow_null=True)
 
     class Meta:
         abstract = True
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if not request.user.is_authenticated:
             return False
@@ -23,12 +28,13 @@ class AbstractUserSerializer(serializers.ModelSerializer):
 
 
 class UserSerializer(AbstractUserSerializer):
+    avatar_renditions = RenditionsField(AVATAR_RENDITIONS, source='avatar')
 
     class Meta:
         model = User
         fields = (
             'email', 'id', 'username', 'first_name',
-            'last_name', 'is_subscribed', 'avatar',
+            'last_name', 'is_subscribed', 'avatar', 'avatar_renditions',
         )
 
 
@@ -87,10 +93,13 @@ class UserRegisteredSerializer(AbstractUserSerializer):
 
 
 class FollowRecipeSerializer(serializers.ModelSerializer):
+    image_renditions = RenditionsField(
+        RECIPE_IMAGE_RENDITIONS, source='image'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -103,29 +112,33 @@ class FollowSerializer(serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
     avatar = Base64ImageField(source='following.avatar')
+    avatar_renditions = RenditionsField(
+        AVATAR_RENDITIONS, source='following.avatar'
+    )
 
     class Meta:
         model = Follow
         fields = (
             'email', 'id', 'username', 'first_name', 'last_name',
-            'is_subscribed', 'recipes', 'recipes_count', 'avatar'
+            'is_subscribed', 'recipes', 'recipes_count', 'avatar',
+            'avatar_renditions'
         )
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            user=obj.user,
-            following=obj.following
-        ).exists()
+        # Объект подписки существует, значит пользователь подписан.
+        return True
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.following)
-
-        if recipes_limit:
-            queryset = queryset[:int(recipes_limit)]
+        if hasattr(obj.following, 'limited_recipes'):
+            queryset = obj.following.limited_recipes
+        else:
+            request = self.context.get('request')
+            recipes_limit = request.query_params.get('recipes_limit')
+            queryset = Recipe.objects.filter(author=obj.following)
+            if recipes_limit:
+                queryset = queryset[:int(recipes_limit)]
 
         return FollowRecipeSerializer(queryset, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.following).count()
+        return obj.following.recipes_count
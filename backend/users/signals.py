@@ -0,0 +1,56 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens
+from foodgram.constants import AVATAR_RENDITIONS
+from foodgram.counters import change_counter, counter_delta
+from foodgram.renditions import file_saved, remember_file
+from recipes.fragments import invalidate_recipe_fragments
+from users.models import Follow, User
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    remember_file(instance, 'avatar')
+
+
+@receiver(post_save, sender=User)
+def avatar_saved(sender, instance, created, update_fields, **kwargs):
+    """Уменьшенные копии нового аватара создаются в фоне.
+
+    Сохранения без смены аватара, например last_login, их не трогают.
+    """
+    file_saved(
+        instance, 'avatar', AVATAR_RENDITIONS, created, update_fields,
+        on_done=lambda: avatar_rendered(instance)
+    )
+
+
+def avatar_rendered(user):
+    """Сброс кэшей, в которых остался пользователь без копий аватара."""
+    invalidate_recipe_fragments(user.recipes.values_list('pk', flat=True))
+    invalidate_tokens(
+        Token.objects.filter(user=user).values_list('key', flat=True)
+    )
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def followers_counted(sender, instance, signal, created=False, **kwargs):
+    delta = counter_delta(signal, created)
+    if delta:
+        change_counter(User, instance.following_id, 'followers_count', delta)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, **kwargs):
+    """Снимок пользователя в кэше токенов устарел: пароль, активность."""
+    if not created:
+        invalidate_tokens(
+            Token.objects.filter(user=instance).values_list('key', flat=True)
+        )
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
@@ -1,22 +1,38 @@
 from django.contrib.auth import authenticate
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Value
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, permissions, status, viewsets
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from recipes.models import User
+from api.async_views import AsyncReadMixin
+from api.authentication import TokenAuthentication
+from api.conditional import get_not_modified, make_etag, set_validators
+from foodgram.timing import TimingMixin
+from recipes.models import Recipe, User
+from recipes.timeline import backfill_timeline, trim_timeline
 from .models import Follow
 from .serializers import (FollowSerializer, UserRegisteredSerializer,
                           UserRegistrationSerializer, UserSerializer)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(TimingMixin, AsyncReadMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.AllowAny]
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
+    def get_queryset(self):
+        """Пользователи с флагом подписки одним подзапросом EXISTS."""
+        if not self.request.user.is_authenticated:
+            return User.objects.annotate(is_subscribed=Value(False))
+        return User.objects.annotate(is_subscribed=Exists(
+            Follow.objects.filter(
+                user=self.request.user, following=OuterRef('pk')
+            )
+        ))
+
     def create(self, request, *args, **kwargs):
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
@@ -52,13 +68,56 @@ class UserViewSet(viewsets.ModelViewSet):
             status=status.HTTP_204_NO_CONTENT
         )
 
+    def retrieve(self, request, *args, **kwargs):
+        """Профиль пользователя с поддержкой условных запросов."""
+        if request.user.is_authenticated:
+            is_subscribed = Exists(Follow.objects.filter(
+                user=request.user, following=OuterRef('pk')
+            ))
+        else:
+            is_subscribed = Value(False)
+        updated_at, is_subscribed = generics.get_object_or_404(
+            User.objects.annotate(is_subscribed=is_subscribed)
+            .values_list('updated_at', 'is_subscribed'),
+            pk=kwargs['pk']
+        )
+        etag = make_etag(kwargs['pk'], updated_at, is_subscribed)
+        not_modified = get_not_modified(request, etag, updated_at)
+        if not_modified is not None:
+            return not_modified
+        response = super().retrieve(request, *args, **kwargs)
+        return set_validators(response, etag, updated_at)
+
     @action(detail=False, methods=['GET', ],
             url_path='me',
             permission_classes=[permissions.IsAuthenticated])
     def me(self, request, *args, **kwargs):
         user = request.user
+        etag = make_etag(user.pk, user.updated_at)
+        not_modified = get_not_modified(request, etag, user.updated_at)
+        if not_modified is not None:
+            return not_modified
+        # Подписаться на себя нельзя: флаг известен без запроса к БД.
+        user.is_subscribed = False
         serializer = UserSerializer(user, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        return set_validators(response, etag, user.updated_at)
+
+    async def ame(self, request, *args, **kwargs):
+        """Профиль текущего пользователя в режиме ASGI.
+
+        Пользователь уже загружен при аутентификации, а подписаться
+        на себя нельзя, поэтому запросов к БД нет.
+        """
+        user = request.user
+        etag = make_etag(user.pk, user.updated_at)
+        not_modified = get_not_modified(request, etag, user.updated_at)
+        if not_modified is not None:
+            return not_modified
+        user.is_subscribed = False
+        serializer = UserSerializer(user, context={'request': request})
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        return set_validators(response, etag, user.updated_at)
 
     @action(detail=False, methods=['PUT', 'DELETE', ],
             url_path='me/avatar',
@@ -100,7 +159,21 @@ class UserViewSet(viewsets.ModelViewSet):
             )
     def subscriptions(self, request, *args, **kwargs):
         user = request.user
-        following = user.following.all()
+        recipes = Recipe.objects.only('id', 'name', 'image', 'rendered_image',
+                                      'cooking_time', 'author_id')
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes[:int(recipes_limit)]
+        following = (
+            user.following
+            .select_related('following')
+            .prefetch_related(Prefetch(
+                'following__recipes',
+                queryset=recipes,
+                to_attr='limited_recipes'
+            ))
+            .order_by('id')
+        )
         paginated_queryset = self.paginate_queryset(following)
         serializer = FollowSerializer(
             paginated_queryset,
@@ -130,7 +203,9 @@ class UserViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            follow = Follow.objects.create(user=user, following=following)
+            with transaction.atomic():
+                follow = Follow.objects.create(user=user, following=following)
+                backfill_timeline(user.pk, following.pk)
             serializer = FollowSerializer(
                 follow,
                 context={'request': request}
@@ -145,11 +220,13 @@ class UserViewSet(viewsets.ModelViewSet):
             )
             if not follow:
                 return Response(status=status.HTTP_400_BAD_REQUEST)
-            follow.delete()
+            with transaction.atomic():
+                follow.delete()
+                trim_timeline(user.pk, following.pk)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class GetToken(generics.CreateAPIView):
+class GetToken(TimingMixin, generics.CreateAPIView):
     permission_classes = [permissions.AllowAny, ]
 
     def post(self, request, *args, **kwargs):
@@ -173,7 +250,7 @@ class GetToken(generics.CreateAPIView):
         return Response({'auth_token': token.key}, status=status.HTTP_200_OK)
 
 
-class DeleteToken(generics.DestroyAPIView):
+class DeleteToken(TimingMixin, generics.DestroyAPIView):
     authentication_classes = [TokenAuthentication]
     permission_classes = [permissions.IsAuthenticated, ]
 